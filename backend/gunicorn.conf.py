@@ -0,0 +1,47 @@
+import gc
+import os
+import multiprocessing
+
+# Gunicorn configuration for the Bahtsul Masail backend.
+# Run from the backend directory with: gunicorn -c gunicorn.conf.py main:app
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+pidfile = os.getenv('GUNICORN_PIDFILE', '/tmp/bahtsul-masail-gunicorn.pid')
+
+# Load the app, and with PRELOAD_MODELS=1 the NLP models, once in the master.
+# Forked workers then share the model weights copy-on-write instead of each
+# holding its own copy. Use scripts/worker_memory_report.py to check the sharing.
+preload_models = os.getenv('PRELOAD_MODELS', '1') == '1'
+preload_app = preload_models
+
+def when_ready(server):
+    """Runs in the master after the app is loaded and before any worker is forked"""
+    if not preload_models:
+        return
+
+    from services.model_registry import model_registry, PRELOAD_SPECS
+    from services.embedding_vocabulary import preload_vocabularies
+
+    server.log.info("Preloading models in the master process")
+    model_registry.preload(PRELOAD_SPECS)
+    # Prototype matrices cached on disk are shared like the weights; any not
+    # cached yet are encoded by the workers' warmup
+    vocabularies = preload_vocabularies(encode=False)
+
+    # Move everything allocated so far out of the collector's reach: a gc pass in a
+    # worker would otherwise write to the object headers and un-share their pages
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Preloaded models: {', '.join(model_registry.stats())}")
+    server.log.info(f"Preloaded vocabularies: {', '.join(vocabularies) or 'none'}")
+
+def post_fork(server, worker):
+    """Give each worker its share of the CPU for intra-op parallelism"""
+    import torch
+
+    threads = max(1, multiprocessing.cpu_count() // workers)
+    torch.set_num_threads(threads)
+    server.log.info(f"Worker {worker.pid} using {threads} torch threads")
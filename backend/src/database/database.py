@@ -1,10 +1,14 @@
 from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError, TimeoutError as PoolTimeoutError
 from fastapi import HTTPException, status
 from dotenv import load_dotenv
+from typing import Optional
+from services.metrics import metrics
 import os
+import threading
 import time
 import logging
 
@@ -31,12 +35,64 @@ DB_NAME = os.getenv("DB_NAME")
 # Create database URL
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Create SQLAlchemy engine with optimized connection pool settings
+# Connection budget: DB_MAX_CONNECTIONS is what this app may hold on the server
+# in total, split evenly across the gunicorn workers. A worker runs sync
+# endpoints and dependencies on at most DB_THREADS_PER_WORKER threads (the
+# AnyIO thread pool), so it never needs more connections than that at once.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "90"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "4"))
+DB_THREADS_PER_WORKER = int(os.getenv("DB_THREADS_PER_WORKER", "40"))
+DB_CONNECTIONS_PER_WORKER = max(1, DB_MAX_CONNECTIONS // WEB_CONCURRENCY)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", min(DB_THREADS_PER_WORKER, DB_CONNECTIONS_PER_WORKER)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", max(0, DB_CONNECTIONS_PER_WORKER - DB_POOL_SIZE)))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Seconds between background connectivity checks while the database is up,
+# and the longest backoff between checks while it is down
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "30"))
+DB_HEALTH_MAX_BACKOFF = float(os.getenv("DB_HEALTH_MAX_BACKOFF", "30"))
+
+POOL_WAIT_MS_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 30000]
+
+_pool_size = metrics.gauge("db_pool_size", "Connections kept open by this worker's pool")
+_pool_checked_out = metrics.gauge("db_pool_checked_out", "Connections currently in use")
+_pool_overflow = metrics.gauge("db_pool_overflow", "Connections open beyond the pool size")
+_pool_wait_ms = metrics.histogram("db_pool_wait_ms", POOL_WAIT_MS_BUCKETS, "Time to check out a connection")
+_pool_timeouts = metrics.counter("db_pool_timeouts", "Checkouts that gave up after DB_POOL_TIMEOUT")
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait times and its checked-out and overflow counts"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            _pool_timeouts.inc()
+            raise
+        finally:
+            _pool_wait_ms.observe((time.perf_counter() - started) * 1000)
+        self._update_gauges()
+        return connection
+
+    def _do_return_conn(self, record) -> None:
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        _pool_checked_out.set(self.checkedout())
+        _pool_overflow.set(max(0, self.overflow()))
+
+# Create SQLAlchemy engine; pool_pre_ping validates each connection as it is
+# checked out, so a request never gets a connection the server has dropped
 engine = create_engine(
     DATABASE_URL,
-    pool_size=10,  # Increased for better concurrency
-    max_overflow=20,
-    pool_timeout=30,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
     pool_recycle=1800,  # Recycle connections every 30 minutes
     pool_pre_ping=True,  # Enable connection health checks
     connect_args={
@@ -45,6 +101,7 @@ engine = create_engine(
         "keepalives_idle": 60  # Idle time before sending keepalive
     }
 )
+_pool_size.set(DB_POOL_SIZE)
 
 # Verify database connection
 try:
@@ -55,39 +112,98 @@ except SQLAlchemyError as e:
     logger.error(f"Failed to connect to database: {str(e)}")
     raise
 
+# Forked workers must not share the connections the master opened; they open their own
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+class DatabaseHealth:
+    """Background connectivity check of one worker process.
+
+    A daemon thread checks the database every DB_HEALTH_INTERVAL seconds.
+    Once a check or a request reports a connection failure, it rechecks
+    with exponential backoff until the database answers again. Requests
+    meanwhile fail fast instead of each waiting on a connection attempt.
+    """
+
+    def __init__(self):
+        self.available = True
+        self.backoff = 0.0
+        self._wake = threading.Event()
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._available = metrics.gauge("db_available", "1 while the database answers health checks")
+        self._available.set(1)
+
+    def ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="db-health", daemon=True).start()
+
+    def report_failure(self) -> None:
+        """A request lost its connection; recheck now instead of at the next interval"""
+        self._set_available(False)
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.backoff if not self.available else DB_HEALTH_INTERVAL)
+            self._wake.clear()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            except SQLAlchemyError as e:
+                self.backoff = min(max(self.backoff * 2, 1.0), DB_HEALTH_MAX_BACKOFF)
+                logger.warning(f"Database health check failed, retrying in {self.backoff:.0f}s: {str(e)}")
+                self._set_available(False)
+            else:
+                if not self.available:
+                    logger.info("Database connection restored")
+                self.backoff = 0.0
+                self._set_available(True)
+
+    def _set_available(self, available: bool) -> None:
+        self.available = available
+        self._available.set(1 if available else 0)
+
+database_health = DatabaseHealth()
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create Base class
 Base = declarative_base()
 
-# Dependency to get database session with enhanced error handling and retry logic
+# Dependency to get a database session. The connection is checked out on
+# first use and validated by pool_pre_ping; there is no per-request probe.
 def get_db():
-    max_retries = 3
-    retry_delay = 1  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            db = SessionLocal()
-            # Test the connection with proper error handling
-            try:
-                db.execute(text("SELECT 1"))
-                yield db
-            except SQLAlchemyError as e:
-                logger.error(f"Database query failed: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Database query error"
-                )
-            finally:
-                db.close()
-            return
-        except SQLAlchemyError as e:
-            if attempt == max_retries - 1:
-                logger.error(f"Database connection failed after {max_retries} attempts: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Database connection error"
-                )
-            logger.warning(f"Database connection attempt {attempt + 1} failed: {str(e)}")
-            time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
\ No newline at end of file
+    database_health.ensure_started()
+    if not database_health.available:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database connection error",
+            headers={"Retry-After": str(max(1, int(database_health.backoff)))}
+        )
+
+    db = SessionLocal()
+    try:
+        yield db
+    except DBAPIError as e:
+        # Only a lost connection says anything about the database as a whole;
+        # timeouts and deadlocks fail just this request
+        if e.connection_invalidated:
+            database_health.report_failure()
+        logger.error(f"Database query failed: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database query error"
+        )
+    except SQLAlchemyError as e:
+        logger.error(f"Database query failed: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database query error"
+        )
+    finally:
+        db.close()
@@ -3,6 +3,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.documents import router as documents_router
 from routes.auth import router as auth_router
+from routes.metrics import router as metrics_router
+from services.model_registry import model_registry, PRELOAD_SPECS
+from services.embedding_vocabulary import preload_vocabularies
+
+# Load (unless the gunicorn master preloaded them) and run the shared models and
+# vocabularies once in each worker before it serves, so no request pays for them
+WARMUP_MODELS = os.getenv('WARMUP_MODELS', '1') == '1'
 
 app = FastAPI(
     title="Bahtsul Masail Engine",
@@ -26,6 +33,14 @@ app.add_middleware(
 
 app.include_router(documents_router)
 app.include_router(auth_router)
+app.include_router(metrics_router)
+
+@app.on_event("startup")
+def warmup_models():
+    if WARMUP_MODELS:
+        model_registry.warmup(PRELOAD_SPECS)
+        # Prototype matrices the master did not preload from the disk cache
+        preload_vocabularies()
 
 @app.get("/")
 async def root():
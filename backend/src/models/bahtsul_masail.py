@@ -1,7 +1,37 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table, Computed, Index, DDL, event
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from database.database import Base
+import os
+import re
+
+# Text search configuration of the full-text column, e.g. 'indonesian' where the server has it.
+# Changing it requires rebuilding the column (scripts/migrate_search_vector.py --rebuild)
+SEARCH_TS_CONFIG = os.getenv('SEARCH_TS_CONFIG', 'simple')
+if not re.fullmatch(r'[a-z_]+', SEARCH_TS_CONFIG):
+    raise ValueError(f"Invalid SEARCH_TS_CONFIG: {SEARCH_TS_CONFIG}")
+
+# Columns of the full-text column and their ts_rank weights (A ranks highest)
+SEARCH_VECTOR_WEIGHTS = [
+    ('title', 'A'),
+    ('question', 'B'),
+    ('answer', 'C'),
+    ('mushoheh', 'C'),
+    ('prolog', 'D'),
+    ('historical_context', 'D'),
+    ('geographical_context', 'D')
+]
+
+def search_vector_expression(config: str = SEARCH_TS_CONFIG) -> str:
+    """SQL of the generated, weighted tsvector over the document text columns"""
+    return ' || '.join(
+        f"setweight(to_tsvector('{config}'::regconfig, coalesce({column}, '')), '{weight}')"
+        for column, weight in SEARCH_VECTOR_WEIGHTS
+    )
+
+# Columns with trigram (pg_trgm) indexes, searched by the typo-tolerant fuzzy mode
+TRIGRAM_COLUMNS = ['title', 'question', 'mushoheh']
 
 # Association tables for many-to-many relationships
 document_madhab = Table(
@@ -30,15 +60,38 @@ class Document(Base):
     source_document = Column(String(255))  # Reference document name
     historical_context = Column(Text)
     geographical_context = Column(String(255))
-    publication_date = Column(DateTime, default=datetime.utcnow)
+    publication_date = Column(DateTime, nullable=False, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Maintained by Postgres from the text columns; used by services.search, never loaded with rows
+    search_vector = deferred(Column(TSVECTOR, Computed(search_vector_expression(), persisted=True)))
+    # Copies of the madhab and category links for filtering with one indexed
+    # array predicate; kept in sync with the relationships below
+    madhab_ids = Column(ARRAY(Integer), nullable=False, default=list, server_default='{}')
+    category_ids = Column(ARRAY(Integer), nullable=False, default=list, server_default='{}')
+
+    __table_args__ = (
+        Index('ix_documents_search_vector', 'search_vector', postgresql_using='gin'),
+        *(Index(f'ix_documents_{column}_trgm', column, postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'})
+          for column in TRIGRAM_COLUMNS),
+        # Serves newest-first listing and keyset pagination in both directions
+        Index('ix_documents_publication_date_id', 'publication_date', 'id'),
+        Index('ix_documents_madhab_ids', 'madhab_ids', postgresql_using='gin'),
+        Index('ix_documents_category_ids', 'category_ids', postgresql_using='gin'),
+    )
 
     # Relationships
     madhabs = relationship('Madhab', secondary=document_madhab, back_populates='documents')
     categories = relationship('Category', secondary=document_category, back_populates='documents')
     chunks = relationship('DocumentChunk', back_populates='document', cascade='all, delete-orphan')
 
+# The trigram indexes need the pg_trgm operator classes, so create_all enables it first
+event.listen(
+    Document.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
 class Madhab(Base):
     __tablename__ = 'madhabs'
 
@@ -57,4 +110,23 @@ class Category(Base):
     description = Column(Text)
 
     # Relationships
-    documents = relationship('Document', secondary=document_category, back_populates='categories')
\ No newline at end of file
+    documents = relationship('Document', secondary=document_category, back_populates='categories')
+
+def _sync_filter_ids(relationship_name: str, ids_name: str) -> None:
+    """Mirror a Document relationship into its id array, flushed in the same transaction"""
+    collection = getattr(Document, relationship_name)
+
+    @event.listens_for(collection, 'append', propagate=True)
+    def append(document, item, initiator):
+        if item.id is None:
+            raise ValueError(f"{type(item).__name__} must be saved before it is linked to a document")
+        ids = getattr(document, ids_name) or []
+        if item.id not in ids:
+            setattr(document, ids_name, sorted([*ids, item.id]))
+
+    @event.listens_for(collection, 'remove', propagate=True)
+    def remove(document, item, initiator):
+        setattr(document, ids_name, [id for id in getattr(document, ids_name) or [] if id != item.id])
+
+_sync_filter_ids('madhabs', 'madhab_ids')
+_sync_filter_ids('categories', 'category_ids')
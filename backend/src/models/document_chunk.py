@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, ARRAY
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database.database import Base
@@ -12,7 +12,7 @@ class DocumentChunk(Base):
     chunk_type = Column(String(50))  # text, table, figure, etc.
     page_number = Column(Integer)
     section_title = Column(String(255))
-    embedding = Column(ARRAY(Float))  # Store vector embeddings
+    embedding = Column(LargeBinary)  # Packed vector embedding, see services.embedding_codec
     metadata = Column(Text)  # JSON field for additional metadata
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -2,4 +2,5 @@
 from .documents import router as documents_router
 from .auth import router as auth_router
 from .enhanced_documents import router as enhanced_documents_router
-from .search import router as search_router
\ No newline at end of file
+from .search import router as search_router
+from .metrics import router as metrics_router
\ No newline at end of file
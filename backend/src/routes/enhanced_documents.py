@@ -13,11 +13,19 @@ from schemas.search import SearchParams
 
 router = APIRouter()
 
+def get_document_service(db: Session = Depends(get_db)):
+    """Provide an EnhancedDocumentService whose shared models are released after the request"""
+    document_service = EnhancedDocumentService(db)
+    try:
+        yield document_service
+    finally:
+        document_service.close()
+
 @router.post("/api/documents/upload", response_model=Document)
 async def upload_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    document_service: EnhancedDocumentService = Depends(get_document_service)
 ):
     """Upload and process a PDF document with advanced NLP"""
     # Validate file type
@@ -32,7 +40,6 @@ async def upload_document(
         temp_file.close()
         
         # Process the document
-        document_service = EnhancedDocumentService(db)
         document, insights = document_service.process_pdf_document(temp_file.name)
         
         # Schedule background task to clean up temp file
@@ -48,7 +55,7 @@ async def upload_document(
 async def batch_upload_documents(
     background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db)
+    document_service: EnhancedDocumentService = Depends(get_document_service)
 ):
     """Upload and process multiple PDF documents with advanced NLP"""
     # Validate files
@@ -71,7 +78,6 @@ async def batch_upload_documents(
             temp_file.close()
         
         # Process all documents
-        document_service = EnhancedDocumentService(db)
         processed_documents = document_service.batch_process_documents(temp_files)
         
         # Format results
@@ -100,11 +106,10 @@ async def batch_upload_documents(
 @router.get("/api/documents/{document_id}/analyze")
 async def analyze_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    document_service: EnhancedDocumentService = Depends(get_document_service)
 ):
     """Perform advanced analysis on an existing document"""
     try:
-        document_service = EnhancedDocumentService(db)
         analysis_results = document_service.analyze_document(document_id)
         
         return {
@@ -119,11 +124,11 @@ async def analyze_document(
 @router.get("/api/documents/{document_id}/suggest-classifications")
 async def suggest_document_classifications(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    document_service: EnhancedDocumentService = Depends(get_document_service)
 ):
     """Suggest classifications (madhabs and categories) for a document based on content analysis"""
     try:
-        document_service = EnhancedDocumentService(db)
         document = db.query(Document).filter(Document.id == document_id).first()
         if not document:
             raise ValueError(f'Document with id {document_id} not found')
@@ -147,11 +152,11 @@ async def suggest_document_classifications(
 @router.post("/api/documents/{document_id}/extract-references")
 async def extract_document_references(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    document_service: EnhancedDocumentService = Depends(get_document_service)
 ):
     """Extract references and citations from a document using advanced NLP"""
     try:
-        document_service = EnhancedDocumentService(db)
         document = db.query(Document).filter(Document.id == document_id).first()
         if not document:
             raise ValueError(f'Document with id {document_id} not found')
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from typing import Optional
+from services.metrics import metrics
+
+router = APIRouter()
+
+@router.get("/api/metrics")
+async def get_metrics(prefix: Optional[str] = None):
+    """In-process metrics of the worker that served this request"""
+    return metrics.snapshot(prefix)
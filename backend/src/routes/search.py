@@ -1,24 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from database.database import get_db
+from models.bahtsul_masail import Document
 from services.enhanced_search import EnhancedSearchService
 from schemas.search import SearchParams, SearchResponse, SearchResult
+from services.logger import logger
+import threading
 import time
 
 router = APIRouter()
-search_service = EnhancedSearchService()
 
-@router.post("/api/search", response_model=SearchResponse)
+# Created by each worker on its first request, not at import: a preloading
+# gunicorn master imports this module and must not check the index or hold
+# connections that its forked workers would inherit
+_search_service: Optional[EnhancedSearchService] = None
+_search_service_lock = threading.Lock()
+
+def get_search_service() -> EnhancedSearchService:
+    """This process's shared search service"""
+    global _search_service
+    with _search_service_lock:
+        if _search_service is None:
+            _search_service = EnhancedSearchService()
+        return _search_service
+
+@router.post("/api/search", response_model=SearchResponse, response_model_exclude_unset=True)
 async def search_documents(
     search_params: SearchParams,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    search_service: EnhancedSearchService = Depends(get_search_service)
 ) -> SearchResponse:
     """Enhanced search endpoint with support for semantic search and filtering"""
     try:
         # Validate search parameters
-        if not search_params.query and not search_params.filters:
+        has_filters = any([search_params.madhab_ids, search_params.category_ids,
+                           search_params.start_date, search_params.end_date])
+        if not search_params.query and not has_filters:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Either search query or filters must be provided"
@@ -28,10 +47,12 @@ async def search_documents(
         
         try:
             # Perform search
-            results = search_service.search_documents(
+            search = await search_service.search_documents(
                 search_params=search_params,
-                semantic_search=search_params.semantic_search
+                semantic_search=search_params.semantic_search,
+                hybrid_search=search_params.hybrid_search
             )
+            results = search['hits']
         except ValueError as ve:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -46,31 +67,20 @@ async def search_documents(
 
         if not results:
             return SearchResponse(
-                total=0,
+                total=search['total'],
+                total_relation=search['total_relation'],
+                next_cursor=None,
                 results=[],
                 took=0,
+                timings=search['timings'],
                 message="No documents found matching the search criteria"
             )
         
         try:
             # Convert results to response model
-            search_results = [
-                SearchResult(
-                    id=doc['id'],
-                    title=doc.get('title', ''),
-                    question=doc.get('question', ''),
-                    answer=doc.get('answer', ''),
-                    prolog=doc.get('prolog'),
-                    mushoheh=doc.get('mushoheh'),
-                    historical_context=doc.get('historical_context'),
-                    geographical_context=doc.get('geographical_context'),
-                    publication_date=doc.get('publication_date'),
-                    madhab_ids=doc.get('madhab_ids', []),
-                    category_ids=doc.get('category_ids', []),
-                    score=doc.get('_score', 0.0)
-                ) for doc in results
-            ]
-        except KeyError as ke:
+            # Unrequested fields stay unset and are left out of the response
+            search_results = [SearchResult(**doc) for doc in results]
+        except (KeyError, ValueError) as ke:
             logger.error(f"Malformed search result: {str(ke)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -81,9 +91,12 @@ async def search_documents(
         took = (time.time() - start_time) * 1000  # Convert to milliseconds
         
         return SearchResponse(
-            total=len(search_results),
+            total=search['total'],
+            total_relation=search['total_relation'],
+            next_cursor=search['next_cursor'],
             results=search_results,
             took=took,
+            timings=search['timings'],
             message="Search completed successfully"
         )
         
@@ -97,11 +110,16 @@ async def search_documents(
         )
 
 @router.post("/api/index")
-async def index_document(
+def index_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    search_service: EnhancedSearchService = Depends(get_search_service)
 ):
-    """Index or reindex a document in Elasticsearch"""
+    """Index or reindex a document in Elasticsearch.
+
+    A plain def, so FastAPI runs it in its thread pool: the query, the
+    embedding encode and the index calls all block.
+    """
     try:
         # Get document from database
         document = db.query(Document).filter(Document.id == document_id).first()
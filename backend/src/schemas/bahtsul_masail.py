@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class MadhabBase(BaseModel):
     name: str
@@ -58,4 +58,11 @@ class DocumentSearch(BaseModel):
     madhab_ids: Optional[List[int]] = None
     category_ids: Optional[List[int]] = None
     start_date: Optional[datetime] = None
-    end_date: Optional[datetime] = None
\ No newline at end of file
+    end_date: Optional[datetime] = None
+    # 'fulltext' matches words; 'fuzzy' tolerates misspellings and partial words
+    mode: Literal['fulltext', 'fuzzy'] = 'fulltext'
+    # Minimum trigram word similarity of a fuzzy match
+    similarity_threshold: float = Field(default=0.3, gt=0, le=1)
+    limit: int = Field(default=20, ge=1, le=100)
+    # next_cursor of the previous page; omit for the first page
+    cursor: Optional[str] = None
\ No newline at end of file
@@ -1,7 +1,13 @@
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
+# Stored document fields a search can return; id and score come with every hit
+SearchField = Literal[
+    'title', 'question', 'answer', 'prolog', 'mushoheh', 'historical_context',
+    'geographical_context', 'publication_date', 'madhab_ids', 'category_ids'
+]
+
 class SearchParams(BaseModel):
     query: Optional[str] = None
     madhab_ids: Optional[List[int]] = None
@@ -9,24 +15,43 @@ class SearchParams(BaseModel):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     semantic_search: bool = False
+    # Lexical and kNN search run concurrently and fused; takes precedence over semantic_search
+    hybrid_search: bool = False
+    fusion: Literal['rrf', 'weighted'] = 'rrf'
+    semantic_weight: float = Field(default=0.5, ge=0, le=1)  # Weighted fusion only
+    fusion_depth: Optional[int] = Field(default=None, ge=1, le=1000)  # Hits per leg (defaults to HYBRID_FUSION_DEPTH)
+    # Semantic search only: kNN candidates per shard (defaults to KNN_NUM_CANDIDATES)
+    num_candidates: Optional[int] = Field(default=None, ge=1, le=10000)
     limit: int = Field(default=10, ge=1, le=100)
     offset: int = Field(default=0, ge=0)
+    # next_cursor of the previous page; takes the place of offset after the first page
+    cursor: Optional[str] = None
+    # Only return these fields of each hit (all of them by default), e.g. ['title'] for list views
+    fields: Optional[List[SearchField]] = None
+    # Return highlighted fragments of the long text fields instead of their full text
+    snippets: bool = False
 
 class SearchResult(BaseModel):
     id: int
-    title: str
-    question: str
-    answer: str
+    title: Optional[str] = None
+    question: Optional[str] = None
+    answer: Optional[str] = None
     prolog: Optional[str] = None
     mushoheh: Optional[str] = None
     historical_context: Optional[str] = None
     geographical_context: Optional[str] = None
     publication_date: Optional[datetime] = None
-    madhab_ids: List[int]
-    category_ids: List[int]
+    madhab_ids: Optional[List[int]] = None
+    category_ids: Optional[List[int]] = None
     score: Optional[float] = None  # For ranking/relevance score
+    highlights: Optional[Dict[str, List[str]]] = None  # Snippet mode: fragments per field
 
 class SearchResponse(BaseModel):
     total: int
+    # 'gte' when total is only a lower bound (large or kNN result sets), 'estimate' for a planner estimate
+    total_relation: Literal['eq', 'gte', 'estimate'] = 'eq'
+    next_cursor: Optional[str] = None  # Pass as cursor to get the next page; None on the last page
     results: List[SearchResult]
-    took: float  # Time taken in milliseconds
\ No newline at end of file
+    took: float  # Time taken in milliseconds
+    timings: Dict[str, float] = {}  # Milliseconds per search stage (encode, lexical, semantic, fusion)
+    message: Optional[str] = None
\ No newline at end of file
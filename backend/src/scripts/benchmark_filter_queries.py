@@ -0,0 +1,54 @@
+import argparse
+import statistics
+import time
+from sqlalchemy import or_, select, text
+from sqlalchemy.dialects import postgresql
+from database.database import engine
+from models.bahtsul_masail import Document
+
+# Compares the query plans and run times of madhab/category filtering through
+# the association tables (one EXISTS subquery per requested id, as the search
+# used to do) and through the GIN-indexed madhab_ids/category_ids arrays.
+# Run scripts/migrate_filter_ids.py first.
+
+def association_filter(madhab_ids, category_ids):
+    query = select(Document.id)
+    if madhab_ids:
+        query = query.where(or_(*(Document.madhabs.any(id=madhab_id) for madhab_id in madhab_ids)))
+    if category_ids:
+        query = query.where(or_(*(Document.categories.any(id=category_id) for category_id in category_ids)))
+    return query
+
+def array_filter(madhab_ids, category_ids):
+    query = select(Document.id)
+    if madhab_ids:
+        query = query.where(Document.madhab_ids.overlap(madhab_ids))
+    if category_ids:
+        query = query.where(Document.category_ids.overlap(category_ids))
+    return query
+
+def run(conn, name: str, query, repeat: int) -> None:
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = len(conn.execute(text(sql)).all())
+        times.append((time.perf_counter() - started) * 1000)
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).scalars().all()
+    print(f"== {name}: {count} documents, median {statistics.median(times):.2f} ms, best {min(times):.2f} ms")
+    for line in plan:
+        print(f"   {line}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark madhab/category filter query plans")
+    parser.add_argument('--madhab-ids', type=int, nargs='*', default=[1, 2])
+    parser.add_argument('--category-ids', type=int, nargs='*', default=[1])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        run(conn, "association tables", association_filter(args.madhab_ids, args.category_ids), args.repeat)
+        run(conn, "filter arrays", array_filter(args.madhab_ids, args.category_ids), args.repeat)
+
+if __name__ == "__main__":
+    main()
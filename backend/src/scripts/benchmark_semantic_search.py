@@ -0,0 +1,82 @@
+import argparse
+import random
+import time
+from typing import Any, Dict, List
+import numpy as np
+from services.enhanced_search import EnhancedSearchService, INDEX_ALIAS
+
+# Compares semantic search latency of approximate kNN against the brute-force
+# script_score query it replaced. Query vectors are the embeddings of randomly
+# chosen indexed documents; overlap is the share of the exact top-k that kNN
+# also returns.
+
+def script_score_body(query_vector: List[float], k: int) -> Dict[str, Any]:
+    return {
+        'size': k,
+        '_source': False,
+        'query': {
+            'script_score': {
+                'query': {'match_all': {}},
+                'script': {
+                    'source': "cosineSimilarity(params.query_vector, 'text_embedding') + 1.0",
+                    'params': {'query_vector': query_vector}
+                }
+            }
+        }
+    }
+
+def sample_vectors(service: EnhancedSearchService, count: int, seed: int) -> List[List[float]]:
+    results = service.es.search(index=INDEX_ALIAS, body={
+        'size': count,
+        '_source': ['text_embedding'],
+        'query': {'function_score': {'random_score': {'seed': seed, 'field': '_seq_no'}}}
+    })
+    return [hit['_source']['text_embedding'] for hit in results['hits']['hits']]
+
+def run(service: EnhancedSearchService, bodies: List[Dict[str, Any]]):
+    latencies, took, ids = [], [], []
+    for body in bodies:
+        started = time.perf_counter()
+        result = service.es.search(index=INDEX_ALIAS, body=body)
+        latencies.append((time.perf_counter() - started) * 1000)
+        took.append(result['took'])
+        ids.append([hit['_id'] for hit in result['hits']['hits']])
+    return np.array(latencies), np.array(took), ids
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency of kNN against script_score semantic search")
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--num-candidates', type=int, nargs='+', default=[50, 100, 200, 500])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    service = EnhancedSearchService()
+    try:
+        vectors = sample_vectors(service, args.queries, args.seed)
+        random.Random(args.seed).shuffle(vectors)
+        print(f"{len(vectors)} queries, k={args.k}")
+
+        # Warm up caches so the first mode measured is not penalized
+        run(service, [script_score_body(vector, args.k) for vector in vectors[:5]])
+
+        latencies, took, exact_ids = run(service, [script_score_body(vector, args.k) for vector in vectors])
+        print(f"{'mode':>20}{'p50 ms':>10}{'p95 ms':>10}{'es took':>10}{'overlap':>10}")
+        print(f"{'script_score':>20}{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 95):>10.1f}"
+              f"{took.mean():>10.1f}{1.0:>10.3f}")
+
+        for num_candidates in args.num_candidates:
+            bodies = [{
+                'size': args.k,
+                '_source': False,
+                'knn': service._knn_clause(vector, args.k, [], num_candidates)
+            } for vector in vectors]
+            latencies, took, knn_ids = run(service, bodies)
+            overlap = np.mean([len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(exact_ids, knn_ids)])
+            print(f"{'knn ' + str(num_candidates):>20}{np.percentile(latencies, 50):>10.1f}"
+                  f"{np.percentile(latencies, 95):>10.1f}{took.mean():>10.1f}{overlap:>10.3f}")
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Checks that searches do not block the event loop. A local stub HTTP server
+# plays Elasticsearch and answers every search after a fixed delay; the script
+# runs many distinct lexical searches concurrently on one event loop (identical
+# ones would be merged into one request) while a heartbeat task measures how
+# long the loop is ever stalled. With a non-blocking client the wall time is
+# close to a single delay, not the sum of them. Postgres and the embedding
+# model are stubbed out too: lexical searches need neither.
+# --fail-status makes the stub answer searches with that status instead, to
+# check that retries stay within ELASTICSEARCH_MAX_RETRIES.
+
+class StubElasticsearch(BaseHTTPRequestHandler):
+    delay = 0.2
+    fail_status = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        # The client refuses to talk to servers that do not identify as Elasticsearch
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def do_HEAD(self):
+        self._reply(200, {})
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if '_search' not in self.path:
+            self._reply(200, {'acknowledged': True})
+            return
+        with StubElasticsearch.lock:
+            StubElasticsearch.requests += 1
+        time.sleep(self.delay)
+        if self.fail_status:
+            self._reply(self.fail_status, {'error': 'stub failure', 'status': self.fail_status})
+            return
+        self._reply(200, {
+            'took': int(self.delay * 1000),
+            'timed_out': False,
+            'hits': {'total': {'value': 1, 'relation': 'eq'}, 'max_score': 1.0, 'hits': [
+                {'_index': 'documents-v1', '_id': '1', '_score': 1.0, '_source': {'title': 'Shalat Jumat'}}
+            ]}
+        })
+
+class StubServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 makes extra concurrent connects wait for a SYN retry
+    request_queue_size = 256
+
+async def heartbeat(stop: asyncio.Event, interval: float, stalls: list) -> None:
+    """Record how late the loop wakes this task up; a blocked loop shows up as a long stall"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+def stub_database() -> None:
+    """Stand in for database.database, which connects to Postgres on import"""
+    from sqlalchemy.orm import declarative_base
+
+    module = types.ModuleType('database.database')
+    module.Base = declarative_base()
+    sys.modules['database.database'] = module
+
+async def run(concurrency: int) -> None:
+    stub_database()
+    from schemas.search import SearchParams
+    from services.enhanced_search import EnhancedSearchService
+
+    # Skip __init__: it loads the embedding model and checks the index
+    service = EnhancedSearchService.__new__(EnhancedSearchService)
+    stop = asyncio.Event()
+    stalls: list = []
+    beat = asyncio.create_task(heartbeat(stop, 0.01, stalls))
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *[service.search_documents(SearchParams(query=f'shalat jumat {i}')) for i in range(concurrency)],
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    await EnhancedSearchService.close_async_client()
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    print(f"{concurrency} searches in {elapsed * 1000:.0f} ms "
+          f"(stub delay {StubElasticsearch.delay * 1000:.0f} ms each, {elapsed / StubElasticsearch.delay:.1f} delays)")
+    print(f"longest event loop stall: {max(stalls, default=0) * 1000:.1f} ms")
+    print(f"search requests received by the stub: {StubElasticsearch.requests}, failed searches: {len(failed)}")
+    if failed:
+        print(f"  e.g. {failed[0]!r}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that searches run concurrently on one event loop")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--delay-ms', type=float, default=200)
+    parser.add_argument('--fail-status', type=int, default=0, help="answer searches with this HTTP status")
+    args = parser.parse_args()
+
+    StubElasticsearch.delay = args.delay_ms / 1000
+    StubElasticsearch.fail_status = args.fail_status
+    server = StubServer(('127.0.0.1', 0), StubElasticsearch)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Must be set before the service module reads it
+    os.environ['ELASTICSEARCH_URL'] = f"http://127.0.0.1:{server.server_port}"
+    try:
+        asyncio.run(run(args.concurrency))
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
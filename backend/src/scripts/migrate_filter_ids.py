@@ -0,0 +1,64 @@
+import argparse
+import time
+from sqlalchemy import text
+from database.database import engine
+
+# Adds documents.madhab_ids and documents.category_ids, fills them from the
+# document_madhab and document_category association tables and builds their
+# GIN indexes. Batches are id-ordered, one transaction each, so the backfill
+# can be stopped and resumed; rows linked by the application while it runs
+# are already kept in sync by the model. Safe to run again at any time to
+# repair drift.
+
+BACKFILL_BATCH = """
+UPDATE documents AS d SET
+    madhab_ids = coalesce((
+        SELECT array_agg(DISTINCT madhab_id ORDER BY madhab_id) FROM document_madhab
+        WHERE document_id = d.id AND madhab_id IS NOT NULL
+    ), '{}'),
+    category_ids = coalesce((
+        SELECT array_agg(DISTINCT category_id ORDER BY category_id) FROM document_category
+        WHERE document_id = d.id AND category_id IS NOT NULL
+    ), '{}')
+WHERE d.id IN (SELECT id FROM documents WHERE id > :last_id ORDER BY id LIMIT :limit)
+RETURNING d.id
+"""
+
+def backfill(batch_size: int) -> int:
+    filled = 0
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(text(BACKFILL_BATCH), {'last_id': last_id, 'limit': batch_size}).scalars().all()
+        if not ids:
+            return filled
+        filled += len(ids)
+        last_id = max(ids)
+        print(f"Filled {filled} documents (up to id {last_id}, {filled / (time.perf_counter() - started):.0f}/s)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add and backfill the madhab/category filter arrays of documents")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        for column in ('madhab_ids', 'category_ids'):
+            conn.execute(text(
+                f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS {column} integer[] NOT NULL DEFAULT '{{}}'"
+            ))
+
+    print(f"Filled {backfill(args.batch_size)} documents in total")
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for column in ('madhab_ids', 'category_ids'):
+            started = time.perf_counter()
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_{column} ON documents USING gin ({column})"
+            ))
+            print(f"ix_documents_{column} ready in {time.perf_counter() - started:.1f}s")
+        conn.execute(text("ANALYZE documents"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import time
+from sqlalchemy import text
+from database.database import engine
+
+# Prepares documents for keyset pagination on (publication_date, id): fills
+# missing publication dates from created_at, makes the column NOT NULL (a
+# NULL would make row comparisons skip documents) and builds the index
+# CONCURRENTLY so the table stays writable.
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prepare documents for keyset pagination")
+    parser.parse_args()
+
+    with engine.begin() as conn:
+        filled = conn.execute(text(
+            "UPDATE documents SET publication_date = coalesce(created_at, now()) WHERE publication_date IS NULL"
+        )).rowcount
+        conn.execute(text("ALTER TABLE documents ALTER COLUMN publication_date SET NOT NULL"))
+        print(f"Filled {filled} missing publication dates")
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        started = time.perf_counter()
+        conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_publication_date_id "
+            "ON documents (publication_date, id)"
+        ))
+        conn.execute(text("ANALYZE documents"))
+        print(f"ix_documents_publication_date_id ready in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import time
+from sqlalchemy import text
+from database.database import engine
+from services.embedding_codec import encode_embedding
+from services.model_registry import MPNET_SENTENCE_MODEL
+
+# Converts document_chunks.embedding from ARRAY(Float) to the packed bytea format.
+#
+# 1. Run without --finalize while the old code is still serving: it adds an
+#    embedding_packed column and fills it in id-ordered batches, one
+#    transaction per batch, so it can be stopped and resumed at any time.
+# 2. Stop the writers and run again with --finalize: it converts anything
+#    written in the meantime, drops the old column and renames the new one.
+#    Then deploy the code that reads the packed column.
+
+def column_type(conn, column: str):
+    return conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'document_chunks' AND column_name = :column"
+    ), {'column': column}).scalar()
+
+def convert_batches(batch_size: int, model: str, dtype: str) -> int:
+    converted = 0
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, embedding FROM document_chunks "
+                "WHERE id > :last_id AND embedding IS NOT NULL AND embedding_packed IS NULL "
+                "ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': batch_size}).all()
+            if not rows:
+                return converted
+            conn.execute(
+                text("UPDATE document_chunks SET embedding_packed = :packed WHERE id = :id"),
+                [{'id': row.id, 'packed': encode_embedding(row.embedding, model, dtype)} for row in rows]
+            )
+        converted += len(rows)
+        last_id = rows[-1].id
+        print(f"Converted {converted} chunks (up to id {last_id}, {converted / (time.perf_counter() - started):.0f}/s)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert chunk embeddings to the packed bytea format")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--model', default=MPNET_SENTENCE_MODEL.model, help="model recorded in the header")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--finalize', action='store_true', help="drop the array column and rename the packed one")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if column_type(conn, 'embedding') == 'bytea' and column_type(conn, 'embedding_packed') is None:
+            print("document_chunks.embedding is already packed")
+            return
+        conn.execute(text("ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_packed BYTEA"))
+
+    print(f"Converted {convert_batches(args.batch_size, args.model, args.dtype)} chunks in total")
+
+    if args.finalize:
+        with engine.begin() as conn:
+            # Catch rows written between the last batch and taking the table lock
+            conn.execute(text("LOCK TABLE document_chunks IN EXCLUSIVE MODE"))
+            rows = conn.execute(text(
+                "SELECT id, embedding FROM document_chunks "
+                "WHERE embedding IS NOT NULL AND embedding_packed IS NULL"
+            )).all()
+            if rows:
+                conn.execute(
+                    text("UPDATE document_chunks SET embedding_packed = :packed WHERE id = :id"),
+                    [{'id': row.id, 'packed': encode_embedding(row.embedding, args.model, args.dtype)} for row in rows]
+                )
+            conn.execute(text("ALTER TABLE document_chunks DROP COLUMN embedding"))
+            conn.execute(text("ALTER TABLE document_chunks RENAME COLUMN embedding_packed TO embedding"))
+        print("Replaced document_chunks.embedding with the packed column")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import time
+from sqlalchemy import text
+from database.database import engine
+from models.bahtsul_masail import SEARCH_TS_CONFIG, search_vector_expression
+
+# Adds the generated, weighted documents.search_vector column and its GIN index.
+# Adding a stored generated column rewrites the table under an exclusive lock,
+# so run it in a quiet period; the index is then built CONCURRENTLY so reads
+# and writes continue. --rebuild drops and recreates the column, e.g. after
+# changing SEARCH_TS_CONFIG.
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add the full-text search column to documents")
+    parser.add_argument('--rebuild', action='store_true', help="drop and recreate an existing column")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if args.rebuild:
+            conn.execute(text("ALTER TABLE documents DROP COLUMN IF EXISTS search_vector"))
+        started = time.perf_counter()
+        conn.execute(text(
+            "ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({search_vector_expression()}) STORED"
+        ))
+        print(f"search_vector column ready ({SEARCH_TS_CONFIG} configuration) in {time.perf_counter() - started:.1f}s")
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        started = time.perf_counter()
+        conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_search_vector "
+            "ON documents USING gin (search_vector)"
+        ))
+        conn.execute(text("ANALYZE documents"))
+        print(f"ix_documents_search_vector ready in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
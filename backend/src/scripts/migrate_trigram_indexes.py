@@ -0,0 +1,28 @@
+import argparse
+import time
+from sqlalchemy import text
+from database.database import engine
+from models.bahtsul_masail import TRIGRAM_COLUMNS
+
+# Enables pg_trgm and builds the GIN trigram indexes used by the fuzzy search
+# mode of services.search. Indexes are built CONCURRENTLY so the documents
+# table stays writable; creating the extension needs a role allowed to do so.
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create the trigram indexes for fuzzy document search")
+    parser.parse_args()
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in TRIGRAM_COLUMNS:
+            started = time.perf_counter()
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_{column}_trgm "
+                f"ON documents USING gin ({column} gin_trgm_ops)"
+            ))
+            print(f"ix_documents_{column}_trgm ready in {time.perf_counter() - started:.1f}s")
+        conn.execute(text("ANALYZE documents"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import time
+from sqlalchemy.orm import selectinload
+from database.database import SessionLocal
+from models.bahtsul_masail import Document
+from services.enhanced_search import (
+    EnhancedSearchService, BULK_ENCODE_BATCH_SIZE, BULK_CHUNK_SIZE, BULK_THREAD_COUNT
+)
+
+# Indexes documents from Postgres into Elasticsearch through the bulk API.
+# By default documents are (re)indexed in place into the indices behind the
+# write alias. Documents are streamed in id order, so an interrupted run can be
+# resumed with --start-id set to the last id it reported.
+#
+# --rebuild builds a fresh versioned index instead (e.g. after changing the
+# analyzer or the embedding model) and atomically swaps the aliases to it once
+# it is complete; searches keep using the old index until then.
+
+def stream_documents(db, start_id: int, yield_per: int):
+    """Documents with their madhabs and categories, in id order, without loading the table"""
+    return db.query(Document)\
+        .options(selectinload(Document.madhabs), selectinload(Document.categories))\
+        .filter(Document.id > start_id)\
+        .order_by(Document.id)\
+        .execution_options(yield_per=yield_per)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk index documents into Elasticsearch")
+    parser.add_argument('--start-id', type=int, default=0, help="resume after this document id")
+    parser.add_argument('--yield-per', type=int, default=500, help="rows fetched from Postgres at a time")
+    parser.add_argument('--encode-batch-size', type=int, default=BULK_ENCODE_BATCH_SIZE)
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help="documents per bulk request")
+    parser.add_argument('--workers', type=int, default=BULK_THREAD_COUNT, help="parallel bulk requests")
+    parser.add_argument('--report-every', type=int, default=1000)
+    parser.add_argument('--rebuild', action='store_true', help="build a new index and swap the aliases to it")
+    parser.add_argument('--delete-old', action='store_true', help="with --rebuild, delete the replaced indices")
+    args = parser.parse_args()
+    if args.rebuild and args.start_id:
+        parser.error("--rebuild always starts from the first document")
+
+    db = SessionLocal()
+    service = EnhancedSearchService()
+    started = time.perf_counter()
+
+    def report(indexed: int, failed: int, last_id: int) -> None:
+        if (indexed + failed) % args.report_every == 0:
+            rate = (indexed + failed) / (time.perf_counter() - started)
+            print(f"indexed {indexed}, failed {failed}, {rate:.0f} docs/s, resume with --start-id {last_id or args.start_id}")
+
+    bulk_options = dict(
+        encode_batch_size=args.encode_batch_size,
+        chunk_size=args.chunk_size,
+        thread_count=args.workers,
+        on_progress=report
+    )
+    try:
+        documents = stream_documents(db, args.start_id, args.yield_per)
+        if args.rebuild:
+            result = service.rebuild_index(documents, delete_old=args.delete_old, **bulk_options)
+            print(f"Aliases now point to {result['index']} (replaced {', '.join(result['previous_indices']) or 'nothing'})")
+        else:
+            result = service.bulk_index_documents(documents, **bulk_options)
+    finally:
+        service.close()
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {result['indexed']} documents in {elapsed:.1f}s, {result['failed']} failed")
+    for error in result['errors'][:10]:
+        print(f"  {error}")
+    if result['failed']:
+        print(f"Resume with --start-id {result['last_id'] or args.start_id}")
+
+if __name__ == "__main__":
+    main()
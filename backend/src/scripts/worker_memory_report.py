@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+from typing import Dict, List
+
+# Reports resident and proportional memory of the gunicorn master and its workers.
+# RSS counts shared pages in every process; PSS splits them between the processes
+# sharing them. When the preloaded model weights are shared copy-on-write, the
+# workers' PSS is far below their RSS and grows little with the worker count.
+
+FIELDS = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty']
+
+def read_memory(pid: int) -> Dict[str, int]:
+    """Read memory counters in kB from /proc/<pid>/smaps_rollup"""
+    values = {field: 0 for field in FIELDS}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            key = parts[0].rstrip(':')
+            if key in values:
+                values[key] = int(parts[1])
+    return values
+
+def child_pids(pid: int) -> List[int]:
+    """Direct children of a process"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The ppid is the second field after the parenthesised command name
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+def format_mb(kb: int) -> str:
+    return f"{kb / 1024:9.1f}"
+
+def report(master_pid: int) -> None:
+    workers = child_pids(master_pid)
+    rows = [('master', master_pid)] + [('worker', pid) for pid in workers]
+
+    print(f"{'role':<8}{'pid':>8}" + ''.join(f"{field + ' MB':>18}" for field in FIELDS))
+    totals = {field: 0 for field in FIELDS}
+    for role, pid in rows:
+        try:
+            memory = read_memory(pid)
+        except OSError as e:
+            print(f"{role:<8}{pid:>8}  unreadable: {str(e)}")
+            continue
+        for field in FIELDS:
+            totals[field] += memory[field]
+        print(f"{role:<8}{pid:>8}" + ''.join(f"{format_mb(memory[field]):>18}" for field in FIELDS))
+
+    print(f"{'total':<16}" + ''.join(f"{format_mb(totals[field]):>18}" for field in FIELDS))
+    if totals['Rss']:
+        shared = totals['Shared_Clean'] + totals['Shared_Dirty']
+        print(f"\n{len(workers)} workers, sum of RSS {format_mb(totals['Rss']).strip()} MB, "
+              f"actual footprint (PSS) {format_mb(totals['Pss']).strip()} MB, "
+              f"{shared / totals['Rss'] * 100:.1f}% of resident memory is shared")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-worker memory report for the gunicorn master")
+    parser.add_argument('--pid', type=int, help="gunicorn master pid")
+    parser.add_argument('--pidfile', default=os.getenv('GUNICORN_PIDFILE', '/tmp/bahtsul-masail-gunicorn.pid'))
+    args = parser.parse_args()
+
+    pid = args.pid
+    if pid is None:
+        try:
+            with open(args.pidfile) as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError) as e:
+            sys.exit(f"Could not read master pid from {args.pidfile}: {str(e)}")
+
+    report(pid)
+
+if __name__ == "__main__":
+    main()
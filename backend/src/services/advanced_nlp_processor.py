@@ -3,34 +3,62 @@ from datetime import datetime
 import os
 import PyPDF2
 import numpy as np
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification, AutoModelForTokenClassification
-from sentence_transformers import SentenceTransformer
 import torch
 from torch import Tensor
 from .logger import logger
+from .model_registry import (
+    model_registry,
+    INDOBERT_CLASSIFIER,
+    INDOBERT_NER,
+    INDOBERT_TOKENIZER,
+    MINILM_SENTENCE_MODEL,
+)
+from .embedding_vocabulary import EmbeddingVocabulary, normalize_rows
+from .analysis_context import DocumentAnalysisContext
 from schemas.bahtsul_masail import DocumentCreate
 
+# Chunks per classifier/encoder call, and neighbouring chunks passed as context on each side
+CLASSIFICATION_BATCH_SIZE = int(os.getenv('CLASSIFICATION_BATCH_SIZE', '16'))
+CLASSIFICATION_CONTEXT_WINDOW = int(os.getenv('CLASSIFICATION_CONTEXT_WINDOW', '0'))
+
+# Prototypical examples for each section type, used to resolve ambiguous classifications
+SECTION_PROTOTYPES = {
+    'prolog': "This question arose during the following context...",
+    'question': "What is the ruling on...",
+    'answer': "The ruling on this matter is...",
+    'mushoheh': "This ruling is verified by the following sources...",
+    'source_document': "This is referenced in the following books..."
+}
+
+# Islamic jurisprudence concepts with the marker phrases that signal them
+CONCEPT_MARKERS = {
+    'maslahah': ['maslahah', 'kemaslahatan umat', 'public interest'],
+    'darurah': ['darurat', 'dharurah', 'keadaan terpaksa', 'necessity'],
+    'qiyas': ['qiyas', 'analogi hukum', 'analogical reasoning'],
+    'ijma': ['ijma', 'kesepakatan ulama', 'consensus of scholars'],
+    'urf': ["'urf", 'adat kebiasaan', 'local custom'],
+    'ijtihad': ['ijtihad', 'penalaran hukum', 'independent reasoning'],
+    'sadd al-dzariah': ['sadd al-dzariah', 'menutup jalan kerusakan', 'blocking the means'],
+    'istihsan': ['istihsan', 'juristic preference']
+}
+
+# Fixed vocabularies embedded once per model version instead of on every call
+SECTION_PROTOTYPE_VOCABULARY = EmbeddingVocabulary('section-prototypes', SECTION_PROTOTYPES, MINILM_SENTENCE_MODEL)
+CONCEPT_MARKER_VOCABULARY = EmbeddingVocabulary(
+    'concept-markers',
+    {marker: marker for markers in CONCEPT_MARKERS.values() for marker in markers},
+    MINILM_SENTENCE_MODEL
+)
+
 class AdvancedNLPProcessor:
+    # Models come from the process-wide registry so they are loaded once, not per instance
+    MODEL_SPECS = (INDOBERT_CLASSIFIER, INDOBERT_NER, MINILM_SENTENCE_MODEL, INDOBERT_TOKENIZER)
+
     def __init__(self):
-        # Initialize text classification pipeline optimized for Indonesian
-        self.classifier = pipeline(
-            "text-classification",
-            model="indolem/indobert-base-uncased",  # Specialized for Indonesian language
-            return_all_scores=True
-        )
-        
-        # Initialize NER pipeline with Indonesian-optimized model
-        self.ner = pipeline(
-            "token-classification",
-            model="indolem/indobert-base-uncased-ner",
-            aggregation_strategy="simple"
-        )
-        
-        # Initialize sentence transformer with Indonesian support
-        self.sentence_model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        
-        # Initialize tokenizer optimized for Indonesian
-        self.tokenizer = AutoTokenizer.from_pretrained("indolem/indobert-base-uncased")
+        # Text classification and NER pipelines optimized for Indonesian, a
+        # sentence transformer with Indonesian support and the tokenizer shared
+        # with the classifier pipeline
+        self.classifier, self.ner, self.sentence_model, self.tokenizer = model_registry.acquire_all(self.MODEL_SPECS)
         
         # Define section labels for fine-grained classification
         self.section_labels = [
@@ -38,6 +66,15 @@ class AdvancedNLPProcessor:
             'historical_context', 'geographical_context'
         ]
 
+    def close(self) -> None:
+        """Release the shared models held by this processor"""
+        for spec in self.MODEL_SPECS:
+            model_registry.release(spec)
+
+    def analysis_context(self) -> DocumentAnalysisContext:
+        """New embedding memo to share between the analysis stages of one document"""
+        return DocumentAnalysisContext(self.sentence_model, batch_size=CLASSIFICATION_BATCH_SIZE)
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Enhanced PDF text extraction with better error handling and OCR fallback"""
         if not os.path.exists(pdf_path):
@@ -187,11 +224,22 @@ class AdvancedNLPProcessor:
         
         return text.strip()
 
-    def classify_text_sections(self, text: str) -> Dict[str, str]:
-        """Enhanced text section classification using advanced NLP techniques"""
+    def classify_text_sections(self, text: str, batch_size: Optional[int] = None,
+                               context_window: Optional[int] = None,
+                               analysis: Optional[DocumentAnalysisContext] = None) -> Dict[str, str]:
+        """Enhanced text section classification using advanced NLP techniques.
+
+        All chunks go through the classifier in batched pipeline calls. With
+        context_window > 0 the neighbouring chunks on each side are passed to
+        the model as the second segment of the input pair. Ambiguous chunks are
+        resolved together in a second batched pass.
+        """
         if not text or not text.strip():
             logger.error("Empty text provided for classification")
             raise ValueError("Empty text provided for classification")
+
+        batch_size = batch_size or CLASSIFICATION_BATCH_SIZE
+        context_window = CLASSIFICATION_CONTEXT_WINDOW if context_window is None else context_window
             
         try:
             # Preprocess text
@@ -201,40 +249,44 @@ class AdvancedNLPProcessor:
             chunks = self._split_into_semantic_chunks(processed_text)
             
             sections = {label: '' for label in self.section_labels}
-            
-            # Use sliding window approach for better context awareness
-            for i, chunk in enumerate(chunks):
-                try:
-                    # Get context by including neighboring chunks if available
-                    context = ''
-                    if i > 0:
-                        context += chunks[i-1] + ' '
-                    context += chunk
-                    if i < len(chunks) - 1:
-                        context += ' ' + chunks[i+1]
-                    
-                    # Classify with context
-                    classification_result = self.classifier(chunk)
-                    if classification_result and len(classification_result) > 0:
-                        # Get top 2 predictions to handle ambiguous sections
-                        top_predictions = sorted(classification_result[0], key=lambda x: x.get('score', 0), reverse=True)[:2]
-                        
-                        # If top prediction is very confident (>0.7), use it
-                        if top_predictions[0]['score'] > 0.7:
-                            section_type = top_predictions[0]['label']
-                        # If top prediction is close to second, use semantic similarity to decide
-                        elif len(top_predictions) > 1 and (top_predictions[0]['score'] - top_predictions[1]['score'] < 0.2):
-                            section_type = self._resolve_ambiguous_classification(chunk, top_predictions)
-                        else:
-                            section_type = top_predictions[0]['label']
-                        
-                        if section_type in sections:
-                            sections[section_type] += chunk + '\n'
-                        else:
-                            logger.warning(f"Unknown section type '{section_type}' for chunk {i}")
-                except Exception as e:
-                    logger.error(f"Failed to classify chunk {i}: {str(e)}")
+
+            # Classify every chunk in batched pipeline calls
+            results = self._classify_chunks(chunks, batch_size, context_window)
+
+            labels: List[Optional[str]] = [None] * len(chunks)
+            ambiguous: List[int] = []
+            ambiguous_predictions: List[List[Dict[str, Any]]] = []
+            for i, classification_result in enumerate(results):
+                if not classification_result:
                     continue
+                # Get top 2 predictions to handle ambiguous sections
+                top_predictions = sorted(classification_result, key=lambda x: x.get('score', 0), reverse=True)[:2]
+                
+                # If top prediction is very confident (>0.7), use it
+                if top_predictions[0]['score'] > 0.7:
+                    labels[i] = top_predictions[0]['label']
+                # If top prediction is close to second, use semantic similarity to decide
+                elif len(top_predictions) > 1 and (top_predictions[0]['score'] - top_predictions[1]['score'] < 0.2):
+                    ambiguous.append(i)
+                    ambiguous_predictions.append(top_predictions)
+                else:
+                    labels[i] = top_predictions[0]['label']
+
+            # Resolve all ambiguous chunks together
+            if ambiguous:
+                resolved = self._resolve_ambiguous_classifications(
+                    [chunks[i] for i in ambiguous], ambiguous_predictions, analysis
+                )
+                for i, section_type in zip(ambiguous, resolved):
+                    labels[i] = section_type
+
+            for i, (chunk, section_type) in enumerate(zip(chunks, labels)):
+                if section_type is None:
+                    continue
+                if section_type in sections:
+                    sections[section_type] += chunk + '\n'
+                else:
+                    logger.warning(f"Unknown section type '{section_type}' for chunk {i}")
             
             # Validate that essential sections are present
             if not sections['question'].strip() or not sections['answer'].strip():
@@ -247,6 +299,38 @@ class AdvancedNLPProcessor:
             logger.error(f"Error during text classification: {str(e)}")
             raise
 
+    def _classify_chunks(self, chunks: List[str], batch_size: int,
+                         context_window: int) -> List[Optional[List[Dict[str, Any]]]]:
+        """Run the classifier over all chunks, returning all label scores per chunk"""
+        inputs: List[Any] = []
+        for i, chunk in enumerate(chunks):
+            if context_window > 0:
+                # Neighbouring chunks become the second segment of the pair
+                context = ' '.join(
+                    chunks[max(0, i - context_window):i] + chunks[i + 1:i + 1 + context_window]
+                )
+                inputs.append({'text': chunk, 'text_pair': context} if context else chunk)
+            else:
+                inputs.append(chunk)
+
+        try:
+            results = self.classifier(inputs, batch_size=batch_size, truncation=True)
+        except Exception as e:
+            logger.error(f"Batched classification failed, classifying chunks one by one: {str(e)}")
+            results = []
+            for i, item in enumerate(inputs):
+                try:
+                    results.append(self.classifier(item, truncation=True))
+                except Exception as chunk_error:
+                    logger.error(f"Failed to classify chunk {i}: {str(chunk_error)}")
+                    results.append(None)
+
+        # A single input comes back wrapped in an extra list
+        return [
+            result[0] if result and isinstance(result[0], list) else result
+            for result in results
+        ]
+
     def extract_metadata(self, text: str) -> Dict[str, Optional[Union[str, date, List[str]]]]:
         """Enhanced metadata extraction with more advanced entity recognition"""
         if not isinstance(text, str):
@@ -401,33 +485,33 @@ class AdvancedNLPProcessor:
 
     def _resolve_ambiguous_classification(self, chunk: str, predictions: List[Dict[str, Any]]) -> str:
         """Resolve ambiguous classification using semantic similarity"""
-        # Get embeddings for the chunk
-        chunk_embedding = self.sentence_model.encode(chunk)
-        
-        # Define prototypical examples for each section type
-        prototypes = {
-            'prolog': "This question arose during the following context...",
-            'question': "What is the ruling on...",
-            'answer': "The ruling on this matter is...",
-            'mushoheh': "This ruling is verified by the following sources...",
-            'source_document': "This is referenced in the following books..."
-        }
-        
-        # Get embeddings for prototypes of the top predicted classes
-        similarities = {}
-        for pred in predictions:
-            label = pred['label']
-            if label in prototypes:
-                prototype_embedding = self.sentence_model.encode(prototypes[label])
-                similarity = self._cosine_similarity(chunk_embedding, prototype_embedding)
-                similarities[label] = similarity
-        
-        # Return the label with highest semantic similarity
-        if similarities:
-            return max(similarities.items(), key=lambda x: x[1])[0]
-        else:
-            # Fallback to highest score if no prototypes match
-            return predictions[0]['label']
+        return self._resolve_ambiguous_classifications([chunk], [predictions])[0]
+
+    def _resolve_ambiguous_classifications(self, chunks: List[str],
+                                           predictions: List[List[Dict[str, Any]]],
+                                           analysis: Optional[DocumentAnalysisContext] = None) -> List[str]:
+        """Resolve several ambiguous classifications with one batched encode"""
+        if analysis is None:
+            analysis = self.analysis_context()
+        chunk_embeddings = analysis.embed_many(chunks)
+        
+        # One matrix product against the precomputed prototype embeddings
+        similarities = SECTION_PROTOTYPE_VOCABULARY.similarities(chunk_embeddings)
+        
+        resolved = []
+        for chunk_similarities, preds in zip(similarities, predictions):
+            candidates = [pred['label'] for pred in preds if pred['label'] in SECTION_PROTOTYPE_VOCABULARY]
+            
+            # Use the label with highest semantic similarity
+            if candidates:
+                resolved.append(max(
+                    candidates,
+                    key=lambda label: chunk_similarities[SECTION_PROTOTYPE_VOCABULARY.index_of(label)]
+                ))
+            else:
+                # Fallback to highest score if no prototypes match
+                resolved.append(preds[0]['label'])
+        return resolved
 
     def _cosine_similarity(self, a: Union[np.ndarray, Tensor], b: Union[np.ndarray, Tensor]) -> float:
         """Calculate cosine similarity between two vectors with type checking"""
@@ -495,9 +579,12 @@ class AdvancedNLPProcessor:
         
         return chunks
 
-    def _extract_additional_insights(self, text: str, sections: Dict[str, str]) -> Dict[str, Any]:
+    def _extract_additional_insights(self, text: str, sections: Dict[str, str],
+                                     analysis: Optional[DocumentAnalysisContext] = None) -> Dict[str, Any]:
         """Extract additional insights from document content"""
         insights = {}
+        if analysis is None:
+            analysis = self.analysis_context()
         
         # Analyze sentiment
         insights['sentiment'] = self._analyze_sentiment(text)
@@ -506,10 +593,10 @@ class AdvancedNLPProcessor:
         insights['complexity'] = self._analyze_complexity(text)
         
         # Extract topics
-        insights['topics'] = self._extract_topics(text)
+        insights['topics'] = self._extract_topics(text, analysis=analysis)
         
         # Extract related concepts
-        insights['related_concepts'] = self._extract_related_concepts(text)
+        insights['related_concepts'] = self._extract_related_concepts(text, analysis)
         
         # Extract references
         insights['references'] = self._extract_references(text)
@@ -565,7 +652,8 @@ class AdvancedNLPProcessor:
             'lexical_diversity': lexical_diversity
         }
     
-    def _extract_topics(self, text: str, num_topics: int = 3) -> List[str]:
+    def _extract_topics(self, text: str, num_topics: int = 3,
+                        analysis: Optional[DocumentAnalysisContext] = None) -> List[str]:
         """Extract main topics from the text using TF-IDF and semantic similarity"""
         if not isinstance(text, str):
             raise TypeError("Input text must be a string")
@@ -574,9 +662,6 @@ class AdvancedNLPProcessor:
             return []
             
         try:
-            # Get sentence embeddings for the text
-            text_embedding = self.sentence_model.encode(text)
-            
             # Extract candidate topics using TF-IDF
             from sklearn.feature_extraction.text import TfidfVectorizer
             vectorizer = TfidfVectorizer(max_features=20, stop_words='english')
@@ -590,32 +675,33 @@ class AdvancedNLPProcessor:
             sorted_idx = np.argsort(scores)[::-1]
             candidates = [feature_names[i] for i in sorted_idx[:num_topics * 2]]
             
-            # Use semantic similarity to select final topics
-            topics = []
-            for candidate in candidates:
-                # Check semantic similarity with existing topics
-                candidate_embedding = self.sentence_model.encode(candidate)
-                is_similar = False
-                
-                for topic in topics:
-                    topic_embedding = self.sentence_model.encode(topic)
-                    similarity = self._cosine_similarity(candidate_embedding, topic_embedding)
-                    if similarity > 0.8:  # High similarity threshold
-                        is_similar = True
-                        break
-                
-                if not is_similar:
-                    topics.append(candidate)
-                    if len(topics) >= num_topics:
-                        break
+            if not candidates:
+                return []
             
-            return topics
+            # Use semantic similarity to select final topics: embed all candidates
+            # in one call and compare them pairwise with a single matrix product
+            if analysis is None:
+                analysis = self.analysis_context()
+            candidate_embeddings = analysis.embed_many(candidates)
+            similarity_matrix = candidate_embeddings @ candidate_embeddings.T
+            
+            accepted: List[int] = []
+            for i in range(len(candidates)):
+                # Skip candidates too similar to an accepted topic
+                if accepted and similarity_matrix[i, accepted].max() > 0.8:  # High similarity threshold
+                    continue
+                accepted.append(i)
+                if len(accepted) >= num_topics:
+                    break
+            
+            return [candidates[i] for i in accepted]
             
         except Exception as e:
             logger.error(f"Error extracting topics: {str(e)}")
             return []
     
-    def _extract_related_concepts(self, text: str) -> List[Dict[str, Any]]:
+    def _extract_related_concepts(self, text: str,
+                                  analysis: Optional[DocumentAnalysisContext] = None) -> List[Dict[str, Any]]:
         """Extract concepts related to the document content using semantic similarity"""
         if not isinstance(text, str):
             raise TypeError("Input text must be a string")
@@ -624,19 +710,18 @@ class AdvancedNLPProcessor:
             return []
             
         try:
-            # Define Islamic jurisprudence concepts with their markers
-            # Get text embedding
-            text_embedding = self.sentence_model.encode(text)
+            # Get text embedding, shared with the other stages of this document's analysis
+            if analysis is None:
+                analysis = self.analysis_context()
+            text_embedding = analysis.embed(text)
+            
+            # Similarity to every concept marker in one matrix-vector product
+            marker_similarities = CONCEPT_MARKER_VOCABULARY.similarities(text_embedding)
             
             # Process each concept
             related_concepts = []
-            for concept, markers in concept_markers.items():
-                # Get embeddings for markers
-                marker_embeddings = [self.sentence_model.encode(marker) for marker in markers]
-                
-                # Calculate average similarity
-                similarities = [self._cosine_similarity(text_embedding, marker_embedding) 
-                              for marker_embedding in marker_embeddings]
+            for concept, markers in CONCEPT_MARKERS.items():
+                similarities = [float(marker_similarities[CONCEPT_MARKER_VOCABULARY.index_of(marker)]) for marker in markers]
                 avg_similarity = sum(similarities) / len(similarities)
                 
                 # If average similarity is high enough, consider it related
@@ -745,14 +830,17 @@ class AdvancedNLPProcessor:
         # Extract text from PDF
         text = self.extract_text_from_pdf(pdf_path)
         
+        # Embeddings computed by one stage are reused by the others
+        analysis = self.analysis_context()
+        
         # Classify text into sections
-        sections = self.classify_text_sections(text)
+        sections = self.classify_text_sections(text, analysis=analysis)
         
         # Extract metadata
         metadata = self.extract_metadata(text)
         
         # Extract additional insights
-        insights = self._extract_additional_insights(text, sections)
+        insights = self._extract_additional_insights(text, sections, analysis)
         
         # Create document
         document = DocumentCreate(
@@ -0,0 +1,33 @@
+from typing import Dict, List, Sequence
+import numpy as np
+from services.embedding_vocabulary import normalize_rows
+
+class DocumentAnalysisContext:
+    """Embedding memo for the analysis of one document.
+
+    Every insight stage asks the context for the embeddings it needs; texts
+    already seen are served from the memo and the rest are encoded together
+    in one batched call. Vectors are L2-normalized float32, so cosine
+    similarity is a plain dot product.
+    """
+
+    def __init__(self, sentence_model, batch_size: int = 32):
+        self.sentence_model = sentence_model
+        self.batch_size = batch_size
+        self._embeddings: Dict[str, np.ndarray] = {}
+
+    def embed(self, text: str) -> np.ndarray:
+        """Normalized embedding of a single text"""
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        """Normalized embeddings of several texts as a matrix, one row per text"""
+        missing = [text for text in dict.fromkeys(texts) if text not in self._embeddings]
+        if missing:
+            encoded = self.sentence_model.encode(
+                missing, batch_size=self.batch_size, convert_to_numpy=True
+            )
+            self._embeddings.update(zip(missing, normalize_rows(encoded)))
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([self._embeddings[text] for text in texts])
@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import threading
+import numpy as np
+from services.logger import logger
+
+# Default lists scanned per query; more lists means better recall and slower queries
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', '8'))
+# Vectors needed before the coarse quantizer is trained; smaller indexes are scanned exactly
+ANN_TRAIN_THRESHOLD = int(os.getenv('ANN_TRAIN_THRESHOLD', '2048'))
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index for cosine similarity.
+
+    Vectors are L2-normalized and assigned to the nearest of n_lists k-means
+    centroids. A query only scans the nprobe lists whose centroids are closest
+    to it, so nprobe trades recall for latency (nprobe == n_lists is exact).
+    Until train_threshold vectors have been added the index is a single list
+    and every query is an exact scan. The quantizer is retrained whenever the
+    index has grown 4x since the last training, keeping lists balanced.
+    """
+
+    def __init__(self, dim: int, nprobe: int = ANN_NPROBE,
+                 train_threshold: int = ANN_TRAIN_THRESHOLD, seed: int = 0):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._list_ids: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+        self._list_vectors: List[np.ndarray] = [np.empty((0, dim), dtype=np.float32)]
+        self._assignments: Dict[int, int] = {}
+        self._trained_size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._assignments)
+
+    def ids(self) -> np.ndarray:
+        """Ids currently in the index"""
+        with self._lock:
+            return np.fromiter(self._assignments, dtype=np.int64, count=len(self._assignments))
+
+    @property
+    def n_lists(self) -> int:
+        return len(self._list_ids)
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """Add vectors under the given ids, replacing any existing entry with the same id"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        vectors = _normalize(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}, got {vectors.shape}")
+
+        with self._lock:
+            self.remove([int(i) for i in ids if int(i) in self._assignments])
+            lists = self._assign(vectors)
+            for list_no in np.unique(lists):
+                mask = lists == list_no
+                self._list_ids[list_no] = np.concatenate([self._list_ids[list_no], ids[mask]])
+                self._list_vectors[list_no] = np.concatenate([self._list_vectors[list_no], vectors[mask]])
+            self._assignments.update(zip(ids.tolist(), lists.tolist()))
+
+            if len(self) >= self.train_threshold and len(self) >= 4 * max(self._trained_size, 1):
+                self.train()
+
+    def remove(self, ids: Sequence[int]) -> int:
+        """Remove ids from the index, returning how many were present"""
+        removed = 0
+        with self._lock:
+            by_list: Dict[int, List[int]] = {}
+            for i in ids:
+                list_no = self._assignments.pop(int(i), None)
+                if list_no is not None:
+                    by_list.setdefault(list_no, []).append(int(i))
+            for list_no, list_ids in by_list.items():
+                keep = ~np.isin(self._list_ids[list_no], list_ids)
+                self._list_ids[list_no] = self._list_ids[list_no][keep]
+                self._list_vectors[list_no] = self._list_vectors[list_no][keep]
+                removed += len(list_ids)
+        return removed
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the ids and cosine similarities of the (approximate) k nearest vectors"""
+        query = _normalize(query)[0]
+        with self._lock:
+            if self._centroids is None:
+                probe = [0]
+            else:
+                probe_count = min(nprobe or self.nprobe, self.n_lists)
+                centroid_scores = self._centroids @ query
+                probe = np.argpartition(-centroid_scores, probe_count - 1)[:probe_count]
+            ids = np.concatenate([self._list_ids[list_no] for list_no in probe])
+            vectors = np.concatenate([self._list_vectors[list_no] for list_no in probe])
+
+        if len(ids) == 0:
+            return ids, np.empty(0, dtype=np.float32)
+        scores = vectors @ query
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def train(self, n_lists: Optional[int] = None, iterations: int = 10) -> None:
+        """(Re)train the coarse quantizer with spherical k-means and reassign every vector"""
+        with self._lock:
+            ids = np.concatenate(self._list_ids)
+            vectors = np.concatenate(self._list_vectors)
+            if len(ids) == 0:
+                return
+            n_lists = n_lists or int(np.clip(np.sqrt(len(ids)), 1, 4096))
+
+            # Train on a sample; a few hundred points per centroid is plenty
+            sample_size = min(len(vectors), n_lists * 256)
+            sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+            centroids = sample[self._rng.choice(len(sample), n_lists, replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                empty = ~np.bincount(assignment, minlength=n_lists).astype(bool)
+                # Re-seed empty clusters with random sample points
+                sums[empty] = sample[self._rng.choice(len(sample), int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            self._centroids = centroids
+            lists = self._assign(vectors)
+            order = np.argsort(lists, kind='stable')
+            bounds = np.searchsorted(lists[order], np.arange(n_lists + 1))
+            self._list_ids = [ids[order[bounds[i]:bounds[i + 1]]] for i in range(n_lists)]
+            self._list_vectors = [vectors[order[bounds[i]:bounds[i + 1]]] for i in range(n_lists)]
+            self._assignments = dict(zip(ids.tolist(), lists.tolist()))
+            self._trained_size = len(ids)
+            logger.info(f"Trained IVF index: {len(ids)} vectors in {n_lists} lists")
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int64)
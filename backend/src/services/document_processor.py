@@ -1,37 +1,46 @@
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 import json
+import os
 import numpy as np
 from PIL import Image
 import pytesseract
 import pdfplumber
 from pdf2image import convert_from_path
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer
 from sqlalchemy.orm import Session
 from models.document_chunk import DocumentChunk
 from services.vector_store import VectorStore
 from services.logger import logger
+from services.model_registry import model_registry, MPNET_SENTENCE_MODEL, LAYOUTLM_CLASSIFIER
+
+# Chunks encoded per forward pass during ingestion
+EMBEDDING_BATCH_SIZE = int(os.getenv('INGEST_EMBEDDING_BATCH_SIZE', '64'))
 
 class DocumentProcessor:
+    MODEL_SPECS = (MPNET_SENTENCE_MODEL, LAYOUTLM_CLASSIFIER)
+
     def __init__(self, db: Session):
         # Initialize OCR engine
         pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
         self.ocr_config = r'--oem 3 --psm 6 -l ind+ara'
         
-        # Initialize text embedding model
-        self.embedding_model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
-        
-        # Initialize layout analysis model
-        self.layout_classifier = pipeline(
-            'text-classification',
-            model='microsoft/layoutlm-base-uncased',
-            return_all_scores=True
-        )
+        # Text embedding and layout analysis models, shared through the model registry
+        self.embedding_model, self.layout_classifier = model_registry.acquire_all(self.MODEL_SPECS)
         
         # Initialize vector store
         self.vector_store = VectorStore(db)
         self.db = db
+
+    def close(self) -> None:
+        """Release the shared models held by this processor"""
+        for spec in self.MODEL_SPECS:
+            model_registry.release(spec)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
     
     def process_document(self, pdf_path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
         """Process document and return metadata and chunks with embeddings"""
@@ -224,17 +233,57 @@ class DocumentProcessor:
         return chunks
     
     def _generate_embeddings(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Generate embeddings for document chunks"""
-        for chunk in chunks:
+        """Generate float32 embeddings for document chunks in length-sorted batches"""
+        self._embed_chunks(chunks)
+        return chunks
+
+    def generate_embeddings_for_documents(self, documents_chunks: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        """Generate embeddings for the chunks of several documents at once so batches stay full"""
+        self._embed_chunks([chunk for chunks in documents_chunks for chunk in chunks])
+        return documents_chunks
+
+    def _embed_chunks(self, chunks: List[Dict[str, Any]], batch_size: int = EMBEDDING_BATCH_SIZE) -> None:
+        """Encode chunks in batches of similar token length, falling back per chunk on failure"""
+        if not chunks:
+            return
+
+        # Sort by token length so each batch pads to roughly the same size
+        texts = [chunk['content'] for chunk in chunks]
+        order = np.argsort(self._token_lengths(texts))[::-1]
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
             try:
-                # Generate embedding for chunk content
-                embedding = self.embedding_model.encode(chunk['content'])
-                chunk['embedding'] = embedding.tolist()
+                embeddings = self.embedding_model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True
+                ).astype(np.float32, copy=False)
+                for i, embedding in zip(batch, embeddings):
+                    chunks[i]['embedding'] = embedding
             except Exception as e:
-                logger.warning(f"Error generating embedding for chunk: {str(e)}")
-                chunk['embedding'] = None
-        
-        return chunks
+                logger.warning(f"Error generating embeddings for batch of {len(batch)} chunks, retrying one by one: {str(e)}")
+                for i in batch:
+                    chunks[i]['embedding'] = self._embed_single(texts[i])
+
+    def _embed_single(self, text: str) -> Optional[np.ndarray]:
+        try:
+            return self.embedding_model.encode(text, convert_to_numpy=True).astype(np.float32, copy=False)
+        except Exception as e:
+            logger.warning(f"Error generating embedding for chunk: {str(e)}")
+            return None
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """Token count per text as seen by the embedding model, capped at its max sequence length"""
+        max_length = self.embedding_model.max_seq_length
+        try:
+            encoded = self.embedding_model.tokenizer(
+                texts, add_special_tokens=False, truncation=True, max_length=max_length
+            )
+            return [len(ids) for ids in encoded['input_ids']]
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable for length sorting, using word counts: {str(e)}")
+            return [min(len(text.split()), max_length) for text in texts]
     
     def _chunk_text(self, text: str, max_length: int = 512) -> List[str]:
         """Split text into semantic chunks"""
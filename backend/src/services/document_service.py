@@ -82,7 +82,9 @@ class DocumentService:
         event = aggregate.add_madhab(UUID(str(madhab_id)))
         self.event_store.append_event(event)
 
-        # Add madhab to document
+        # Add madhab to document; the row lock keeps concurrent links from
+        # overwriting each other's madhab_ids
+        self.db.refresh(document, with_for_update=True)
         document.madhabs.append(madhab)
         self.db.commit()
         self.db.refresh(document)
@@ -101,7 +103,9 @@ class DocumentService:
         event = aggregate.add_category(UUID(str(category_id)))
         self.event_store.append_event(event)
 
-        # Add category to document
+        # Add category to document; the row lock keeps concurrent links from
+        # overwriting each other's category_ids
+        self.db.refresh(document, with_for_update=True)
         document.categories.append(category)
         self.db.commit()
         self.db.refresh(document)
@@ -0,0 +1,128 @@
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+import os
+import queue
+import threading
+import time
+import numpy as np
+from services.logger import logger
+from services.metrics import metrics
+from services.model_registry import model_registry, ModelSpec
+
+# Defaults for the batching window and size, overridable per batcher
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', '5'))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', '32'))
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+WAIT_MS_BUCKETS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250]
+
+class EmbeddingBatcher:
+    """Gathers concurrent encode requests and runs them as one batched forward pass.
+
+    The first request of a batch waits at most max_wait_ms for others to join,
+    or until max_batch_size items are queued. Callers get a Future per text, so
+    the batcher works for threadpool handlers and, via asyncio.wrap_future, for
+    async ones.
+    """
+
+    def __init__(self, spec: ModelSpec, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        self.spec = spec
+        self.max_batch_size = max_batch_size or EMBEDDING_BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else EMBEDDING_BATCH_WINDOW_MS) / 1000
+        self._queue: 'queue.Queue[Tuple[str, Future, float]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        name = spec.model.rsplit('/', 1)[-1]
+        self._queue_depth = metrics.gauge(
+            f'embedding_batcher_queue_depth{{model="{name}"}}',
+            'Requests waiting for a batch slot'
+        )
+        self._batch_sizes = metrics.histogram(
+            f'embedding_batcher_batch_size{{model="{name}"}}', BATCH_SIZE_BUCKETS,
+            'Texts encoded per forward pass'
+        )
+        self._wait_ms = metrics.histogram(
+            f'embedding_batcher_wait_ms{{model="{name}"}}', WAIT_MS_BUCKETS,
+            'Time a request spent queued before its batch ran'
+        )
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a Future resolving to its float32 vector"""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        self._queue_depth.set(self._queue.qsize())
+        return future
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        """Encode a single text, blocking until its batch has run"""
+        return self.submit(text).result(timeout=timeout)
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive a fork, so a batcher created in the gunicorn
+        # master starts its own worker thread in each worker process
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _collect_batch(self) -> List[Tuple[str, Future, float]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            self._queue_depth.set(self._queue.qsize())
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self._wait_ms.observe((started - enqueued) * 1000)
+
+            # Requests cancelled while queued do not need encoding
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._batch_sizes.observe(len(batch))
+
+            try:
+                model = model_registry.get(self.spec)
+                embeddings = model.encode(
+                    [text for text, _, _ in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True
+                ).astype(np.float32, copy=False)
+            except Exception as e:
+                logger.error(f"Batched encoding of {len(batch)} texts failed: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+_batchers: Dict[Tuple, EmbeddingBatcher] = {}
+_batchers_lock = threading.Lock()
+
+def get_embedding_batcher(spec: ModelSpec) -> EmbeddingBatcher:
+    """Process-wide batcher for a sentence-transformer model"""
+    with _batchers_lock:
+        if spec.key not in _batchers:
+            _batchers[spec.key] = EmbeddingBatcher(spec)
+        return _batchers[spec.key]
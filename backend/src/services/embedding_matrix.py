@@ -0,0 +1,270 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence, Set, Tuple
+import fcntl
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from services.logger import logger
+
+# Directory holding the shared embedding matrix; every worker on the host maps the same files
+VECTOR_STORE_DIR = Path(os.getenv('VECTOR_STORE_DIR', Path(__file__).parent.parent.parent / 'cache' / 'vectors'))
+# Compact once this share of the rows are tombstones
+COMPACTION_THRESHOLD = float(os.getenv('VECTOR_COMPACTION_THRESHOLD', '0.2'))
+COMPACTION_INTERVAL = float(os.getenv('VECTOR_COMPACTION_INTERVAL', '300'))
+
+TOMBSTONE = -1
+
+class EmbeddingMatrix:
+    """Append-only, memory-mapped float32 matrix of L2-normalized chunk embeddings.
+
+    Layout: <dir>/current is a symlink to a generation directory holding
+    vectors.f32 (rows of dim float32) and ids.i64 (the DocumentChunk id of
+    each row, TOMBSTONE once deleted). Vectors are written before ids, so the
+    ids file length is the number of committed rows. Writers serialize on an
+    flock; readers only map the files, so all workers share one copy through
+    the page cache. Compaction writes a new generation and swaps the symlink.
+    """
+
+    def __init__(self, dim: int, directory: Optional[Path] = None):
+        self.dim = dim
+        self.directory = Path(directory or VECTOR_STORE_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.directory / 'write.lock'
+        self._current = self.directory / 'current'
+        self._mapped_generation: Optional[str] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._map_lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._compactor_pid: Optional[int] = None
+        # Ids stored in a generation, kept by writers so an append does not rescan the ids file
+        self._stored_generation: Optional[str] = None
+        self._stored_rows = 0
+        self._stored_ids: Set[int] = set()
+
+    def exists(self) -> bool:
+        return self._current.exists()
+
+    def __len__(self) -> int:
+        """Committed rows, including tombstones"""
+        _, ids = self._mapped()
+        return len(ids)
+
+    def max_id(self) -> int:
+        """Highest chunk id stored and not deleted; 0 when there is none"""
+        _, ids = self._mapped()
+        return int(ids.max()) if len(ids) else 0
+
+    def live_count(self) -> int:
+        _, ids = self._mapped()
+        return int(np.count_nonzero(ids != TOMBSTONE))
+
+    def append(self, ids: Sequence[int], vectors: np.ndarray) -> int:
+        """Append rows for the given chunk ids, skipping ids already stored; returns rows added"""
+        if len(ids) == 0:
+            return 0
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = self._normalize(vectors)
+        with self._write_lock():
+            generation = self._ensure_generation()
+            stored = self._stored_id_set(generation)
+            # The same chunk can arrive twice, e.g. from initialize and from its writer
+            new = np.fromiter((i not in stored for i in ids.tolist()), dtype=bool, count=len(ids))
+            if not new.any():
+                return 0
+            ids, vectors = ids[new], vectors[new]
+            # Drop vectors left behind by a writer that died before committing their ids
+            committed = self._stored_rows
+            os.truncate(generation / 'vectors.f32', committed * self.dim * 4)
+            with open(generation / 'vectors.f32', 'ab') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            # Appending the ids commits the rows
+            with open(generation / 'ids.i64', 'ab') as f:
+                f.write(ids.tobytes())
+            stored.update(ids.tolist())
+            self._stored_rows += len(ids)
+        return len(ids)
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """Tombstone every row of the given chunk ids, returning how many rows were hit"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        with self._write_lock():
+            if not self.exists():
+                return 0
+            generation = self._current.resolve()
+            stored = np.fromfile(generation / 'ids.i64', dtype=np.int64)
+            rows = np.flatnonzero(np.isin(stored, ids))
+            if len(rows):
+                stored_ids = np.memmap(generation / 'ids.i64', dtype=np.int64, mode='r+')
+                stored_ids[rows] = TOMBSTONE
+                stored_ids.flush()
+                del stored_ids
+        self.start_compactor()
+        return len(rows)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k by cosine similarity: one matrix-vector product and an argpartition"""
+        vectors, ids = self._mapped()
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = self._normalize(query)[0]
+        scores = vectors[:len(ids)] @ query
+        scores[ids == TOMBSTONE] = -np.inf
+
+        k = min(k, int(np.count_nonzero(ids != TOMBSTONE)))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return np.array(ids[top]), scores[top]
+
+    def rows(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Mapped (vectors, ids) of the current generation; tombstoned ids are TOMBSTONE"""
+        return self._mapped()
+
+    def initialize(self, rows: Iterable[Tuple[Sequence[int], np.ndarray]]) -> bool:
+        """Build the first generation from rows unless another process already has"""
+        with self._write_lock():
+            if self.exists():
+                return False
+            self._write_generation(
+                (ids, self._normalize(vectors)) for ids, vectors in rows
+            )
+            return True
+
+    def rebuild(self, rows: Iterable[Tuple[Sequence[int], np.ndarray]]) -> None:
+        """Write a fresh generation from (ids, vectors) batches and switch to it"""
+        with self._write_lock():
+            self._write_generation(
+                (ids, self._normalize(vectors)) for ids, vectors in rows
+            )
+
+    def compact(self) -> bool:
+        """Drop tombstoned rows by writing a new generation; True if one was written"""
+        with self._write_lock():
+            if not self.exists():
+                return False
+            generation = self._current.resolve()
+            ids = np.fromfile(generation / 'ids.i64', dtype=np.int64)
+            live = ids != TOMBSTONE
+            if len(ids) == 0 or 1 - live.mean() < COMPACTION_THRESHOLD:
+                return False
+            vectors = np.memmap(generation / 'vectors.f32', dtype=np.float32, mode='r',
+                                shape=(len(ids), self.dim))
+            self._write_generation([(ids[live], vectors[live])])
+            logger.info(f"Compacted embedding matrix from {len(ids)} to {int(live.sum())} rows")
+            return True
+
+    def start_compactor(self) -> None:
+        """Start this process's background compaction thread if it is not running"""
+        if self._compactor is not None and self._compactor_pid == os.getpid():
+            return
+        self._compactor_pid = os.getpid()
+        self._compactor = threading.Thread(target=self._compact_loop, name='embedding-compactor', daemon=True)
+        self._compactor.start()
+
+    def _compact_loop(self) -> None:
+        while True:
+            time.sleep(COMPACTION_INTERVAL)
+            try:
+                self.compact()
+            except Exception as e:
+                logger.warning(f"Embedding matrix compaction failed: {str(e)}")
+
+    def _mapped(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Current mapping, refreshed when rows were appended or a new generation was swapped in"""
+        with self._map_lock:
+            for attempt in range(3):
+                try:
+                    return self._map_current()
+                except FileNotFoundError:
+                    # Compaction swapped in a new generation and removed this
+                    # one between reading the link and mapping its files
+                    if attempt == 2:
+                        raise
+                    self._mapped_generation = None
+
+    def _map_current(self) -> Tuple[np.ndarray, np.ndarray]:
+        try:
+            generation = os.readlink(self._current)
+        except FileNotFoundError:
+            return np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64)
+        path = self.directory / generation
+        rows = os.stat(path / 'ids.i64').st_size // 8
+        if generation != self._mapped_generation or self._ids is None or len(self._ids) != rows:
+            if rows == 0:
+                vectors = np.empty((0, self.dim), dtype=np.float32)
+                ids = np.empty(0, dtype=np.int64)
+            else:
+                vectors = np.memmap(path / 'vectors.f32', dtype=np.float32, mode='r', shape=(rows, self.dim))
+                ids = np.memmap(path / 'ids.i64', dtype=np.int64, mode='r', shape=(rows,))
+            self._vectors, self._ids = vectors, ids
+            self._mapped_generation = generation
+        return self._vectors, self._ids
+
+    def _stored_id_set(self, generation: Path) -> Set[int]:
+        """Ids committed to generation, reading only the rows appended since the last call.
+
+        Called under the write lock; other processes' appends show up as new
+        rows and a compaction as a new generation, which is read in full.
+        """
+        rows = os.stat(generation / 'ids.i64').st_size // 8
+        if generation.name != self._stored_generation or rows < self._stored_rows:
+            self._stored_generation = generation.name
+            self._stored_rows = 0
+            self._stored_ids = set()
+        if rows > self._stored_rows:
+            appended = np.fromfile(generation / 'ids.i64', dtype=np.int64,
+                                   count=rows - self._stored_rows, offset=self._stored_rows * 8)
+            self._stored_ids.update(appended.tolist())
+            self._stored_rows = rows
+        return self._stored_ids
+
+    def _ensure_generation(self) -> Path:
+        if not self.exists():
+            self._write_generation([])
+        return self._current.resolve()
+
+    def _write_generation(self, batches: Iterable[Tuple[Sequence[int], np.ndarray]]) -> None:
+        """Write batches into a new generation directory and atomically point current at it"""
+        previous = self._current.resolve() if self.exists() else None
+        name = f"gen-{time.time_ns()}"
+        path = self.directory / name
+        path.mkdir()
+        with open(path / 'vectors.f32', 'wb') as vectors_file, open(path / 'ids.i64', 'wb') as ids_file:
+            for ids, vectors in batches:
+                vectors_file.write(np.asarray(vectors, dtype=np.float32).tobytes())
+                ids_file.write(np.asarray(ids, dtype=np.int64).tobytes())
+            vectors_file.flush()
+            os.fsync(vectors_file.fileno())
+
+        link = self.directory / f"current.{os.getpid()}.tmp"
+        os.symlink(name, link)
+        os.replace(link, self._current)
+
+        # Readers that still map the old files keep them alive until they remap
+        if previous is not None and previous != path:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
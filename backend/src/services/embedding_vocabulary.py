@@ -0,0 +1,159 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import importlib
+import json
+import os
+import re
+import threading
+import numpy as np
+from services.logger import logger
+from services.model_registry import model_registry, ModelSpec
+
+# Where embedded vocabularies are cached between restarts
+EMBEDDING_CACHE_DIR = Path(os.getenv('EMBEDDING_CACHE_DIR', Path(__file__).parent.parent.parent / 'cache' / 'embeddings'))
+
+# Modules that define vocabularies at import time; preload_vocabularies imports them
+VOCABULARY_MODULES = ('services.advanced_nlp_processor',)
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row, leaving zero rows at zero"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def model_version(model) -> str:
+    """Identify the exact weights of a sentence-transformer for cache keys"""
+    try:
+        config = model[0].auto_model.config
+        return getattr(config, '_commit_hash', None) or 'local'
+    except Exception:
+        return 'local'
+
+class EmbeddingVocabulary:
+    """A fixed set of texts embedded once and kept as a normalized float32 matrix.
+
+    Entries map a key (a label, a marker) to the text that gets embedded. The
+    matrix is cached on disk as .npy next to a JSON list of the embedded texts,
+    keyed by model name and version, so a restart loads it instead of
+    re-encoding and adding an entry only encodes that entry.
+    """
+
+    def __init__(self, name: str, entries: Dict[str, str], spec: ModelSpec,
+                 cache_dir: Optional[Path] = None):
+        self.name = name
+        self.keys = list(entries)
+        self.texts = [entries[key] for key in self.keys]
+        self.spec = spec
+        self.cache_dir = Path(cache_dir or EMBEDDING_CACHE_DIR)
+        self._index = {key: i for i, key in enumerate(self.keys)}
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        _vocabularies.append(self)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Normalized embeddings, one row per entry in insertion order"""
+        self.preload()
+        return self._matrix
+
+    def preload(self, encode: bool = True) -> bool:
+        """Build the matrix now; with encode=False only from the disk cache.
+
+        Returns whether the matrix is ready.
+        """
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    self._matrix = self._build(encode)
+        return self._matrix is not None
+
+    def rows(self, keys: Sequence[str]) -> np.ndarray:
+        """Normalized embeddings of the given keys"""
+        return self.matrix[[self._index[key] for key in keys]]
+
+    def index_of(self, key: str) -> int:
+        """Row of the given key in the matrix"""
+        return self._index[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def similarities(self, vectors: np.ndarray) -> np.ndarray:
+        """Cosine similarity of one vector (or a matrix of vectors) to every entry"""
+        return np.clip(normalize_rows(vectors) @ self.matrix.T, -1.0, 1.0)
+
+    def _build(self, encode: bool = True) -> Optional[np.ndarray]:
+        model = model_registry.get(self.spec)
+        path = self._cache_path(model)
+        cached = self._load_cache(path)
+
+        missing = [text for text in dict.fromkeys(self.texts) if text not in cached]
+        if missing and not encode:
+            return None
+        if missing:
+            logger.info(f"Embedding {len(missing)} new entries for vocabulary '{self.name}'")
+            embeddings = normalize_rows(model.encode(missing, convert_to_numpy=True))
+            cached.update(zip(missing, embeddings))
+            self._save_cache(path, {text: cached[text] for text in dict.fromkeys(self.texts)})
+
+        return np.stack([cached[text] for text in self.texts]).astype(np.float32, copy=False)
+
+    def _cache_path(self, model) -> Path:
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{self.spec.model}-{model_version(model)}")
+        return self.cache_dir / f"{self.name}-{slug}.npy"
+
+    def _load_cache(self, path: Path) -> Dict[str, np.ndarray]:
+        try:
+            index = json.loads(path.with_suffix('.json').read_text(encoding='utf-8'))
+            matrix = np.load(path)
+            # The pair is replaced file by file, so check both halves belong together
+            if hashlib.sha1(matrix.tobytes()).hexdigest() != index['checksum']:
+                raise ValueError("text list does not match the matrix")
+            return dict(zip(index['texts'], matrix))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache {path}: {str(e)}")
+            return {}
+
+    def _save_cache(self, path: Path, embeddings: Dict[str, np.ndarray]) -> None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to temporary files first so a concurrent reader never sees half a cache
+            tmp_matrix = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+            tmp_texts = path.with_name(f"{path.stem}.{os.getpid()}.tmp.json")
+            matrix = np.stack(list(embeddings.values())).astype(np.float32)
+            np.save(tmp_matrix, matrix)
+            tmp_texts.write_text(json.dumps({
+                'texts': list(embeddings),
+                'checksum': hashlib.sha1(matrix.tobytes()).hexdigest()
+            }, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_matrix, path)
+            os.replace(tmp_texts, path.with_suffix('.json'))
+        except Exception as e:
+            logger.warning(f"Could not write embedding cache {path}: {str(e)}")
+
+_vocabularies: List[EmbeddingVocabulary] = []
+
+def preload_vocabularies(encode: bool = True) -> List[str]:
+    """Build every vocabulary defined in VOCABULARY_MODULES, returning the ready ones.
+
+    The gunicorn master calls this with encode=False: it must not run
+    inference before forking, so it only loads matrices cached on disk, which
+    the workers then share copy-on-write. Worker warmup calls it with
+    encode=True, which also fills the disk cache for the next start.
+    """
+    for module in VOCABULARY_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning(f"Could not import vocabularies from {module}: {str(e)}")
+    ready = []
+    for vocabulary in _vocabularies:
+        try:
+            if vocabulary.preload(encode):
+                ready.append(vocabulary.name)
+        except Exception as e:
+            logger.warning(f"Could not preload vocabulary '{vocabulary.name}': {str(e)}")
+    return ready
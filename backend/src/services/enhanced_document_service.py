@@ -15,7 +15,16 @@ class EnhancedDocumentService:
         self.db = db
         self.event_store = EventStore(db)
         self.nlp_processor = AdvancedNLPProcessor()
-        self.search_service = EnhancedSearchService()
+        try:
+            self.search_service = EnhancedSearchService()
+        except Exception:
+            self.nlp_processor.close()
+            raise
+
+    def close(self) -> None:
+        """Release the shared models held by the NLP and search services"""
+        self.nlp_processor.close()
+        self.search_service.close()
 
     def process_pdf_document(self, pdf_path: str) -> Tuple[Document, Dict[str, Any]]:
         """Process a PDF document with advanced NLP techniques"""
@@ -130,7 +139,9 @@ class EnhancedDocumentService:
         event = aggregate.add_madhab(UUID(str(madhab_id)))
         self.event_store.append_event(event)
 
-        # Add madhab to document
+        # Add madhab to document; the row lock keeps concurrent links from
+        # overwriting each other's madhab_ids
+        self.db.refresh(document, with_for_update=True)
         document.madhabs.append(madhab)
         self.db.commit()
         self.db.refresh(document)
@@ -153,7 +164,9 @@ class EnhancedDocumentService:
         event = aggregate.add_category(UUID(str(category_id)))
         self.event_store.append_event(event)
 
-        # Add category to document
+        # Add category to document; the row lock keeps concurrent links from
+        # overwriting each other's category_ids
+        self.db.refresh(document, with_for_update=True)
         document.categories.append(category)
         self.db.commit()
         self.db.refresh(document)
@@ -201,11 +214,13 @@ class EnhancedDocumentService:
     
     def _extract_additional_insights(self, text: str) -> Dict[str, Any]:
         """Extract additional insights from document text"""
+        # Share embeddings between the topic and concept stages
+        analysis = self.nlp_processor.analysis_context()
         return {
             'sentiment': self.nlp_processor._analyze_sentiment(text),
             'complexity': self.nlp_processor._analyze_complexity(text),
-            'topics': self.nlp_processor._extract_topics(text),
-            'related_concepts': self.nlp_processor._extract_related_concepts(text)
+            'topics': self.nlp_processor._extract_topics(text, analysis=analysis),
+            'related_concepts': self.nlp_processor._extract_related_concepts(text, analysis)
         }
     
     def _load_aggregate(self, document_id: UUID) -> DocumentAggregate:
@@ -1,76 +1,436 @@
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from elasticsearch import AsyncElasticsearch, Elasticsearch, NotFoundError
+from elasticsearch.helpers import parallel_bulk
+from typing import List, Optional, Dict, Any, Callable, Iterable, Iterator
+from datetime import datetime, timedelta
 from models.bahtsul_masail import Document
 from schemas.bahtsul_masail import DocumentSearch
+from schemas.search import SearchResult
 from sqlalchemy.orm import Session
+from services.model_registry import model_registry, MPNET_SENTENCE_MODEL
+from services.embedding_batcher import get_embedding_batcher
+from services.search_cache import search_cache
+from services.single_flight import SingleFlight
+from services.query_embedding_cache import query_embedding_cache, normalize_query
+from services.pagination import EXACT_TOTAL_LIMIT, decode_cursor, encode_cursor
+from services.rank_fusion import reciprocal_rank_fusion, weighted_score_fusion
+from services.logger import logger
+from itertools import islice
+import asyncio
 import os
+import threading
+import time
+
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200')
+# Connections kept open per node by each client in a worker
+ES_CONNECTIONS_PER_NODE = int(os.getenv('ELASTICSEARCH_CONNECTIONS_PER_NODE', '25'))
+# Timeouts in seconds: searches are on the request path, indexing and admin calls are not
+ES_REQUEST_TIMEOUT = float(os.getenv('ELASTICSEARCH_REQUEST_TIMEOUT', '30'))
+SEARCH_REQUEST_TIMEOUT = float(os.getenv('ELASTICSEARCH_SEARCH_TIMEOUT', '5'))
+# Retries per request on connection errors, timeouts and 502/503/504
+ES_MAX_RETRIES = int(os.getenv('ELASTICSEARCH_MAX_RETRIES', '2'))
+# Sniffing only helps multi-node clusters; on a single node it just adds requests
+ES_SNIFF = os.getenv('ELASTICSEARCH_SNIFF', 'false').lower() == 'true'
+
+# Searches go through the read alias, document writes through the write alias;
+# both point at a versioned index named <alias>-v<timestamp>
+INDEX_ALIAS = os.getenv('ELASTICSEARCH_INDEX', 'documents')
+WRITE_ALIAS = f"{INDEX_ALIAS}-write"
+# How long a worker keeps using the write targets it looked up
+WRITE_ALIAS_CACHE_SECONDS = float(os.getenv('ELASTICSEARCH_WRITE_ALIAS_CACHE_SECONDS', '5'))
+# Settings restored on an index once a rebuild has filled it
+INDEX_REFRESH_INTERVAL = os.getenv('ELASTICSEARCH_REFRESH_INTERVAL', '1s')
+INDEX_REPLICAS = int(os.getenv('ELASTICSEARCH_REPLICAS', '1'))
+INDEX_HEALTH_TIMEOUT = os.getenv('ELASTICSEARCH_HEALTH_TIMEOUT', '10m')
+# How long an index being rebuilt remembers deletes, so the backfill cannot bring a deleted document back
+REBUILD_GC_DELETES = os.getenv('ELASTICSEARCH_REBUILD_GC_DELETES', '24h')
+
+# HNSW graph parameters of text_embedding; changing them needs a --rebuild
+HNSW_M = int(os.getenv('ELASTICSEARCH_HNSW_M', '16'))
+HNSW_EF_CONSTRUCTION = int(os.getenv('ELASTICSEARCH_HNSW_EF_CONSTRUCTION', '100'))
+# Candidates gathered per shard by semantic search; more is slower but closer to exact
+KNN_NUM_CANDIDATES = int(os.getenv('KNN_NUM_CANDIDATES', '100'))
+
+# Hits each leg of a hybrid search retrieves before fusion
+HYBRID_FUSION_DEPTH = int(os.getenv('HYBRID_FUSION_DEPTH', '50'))
+# How long a paged search keeps its point-in-time open between two pages
+PIT_KEEP_ALIVE = os.getenv('ELASTICSEARCH_PIT_KEEP_ALIVE', '5m')
+
+# Defaults for bulk (re)indexing; see scripts/reindex_documents.py
+BULK_ENCODE_BATCH_SIZE = int(os.getenv('BULK_ENCODE_BATCH_SIZE', '256'))
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '500'))
+BULK_THREAD_COUNT = int(os.getenv('BULK_THREAD_COUNT', '4'))
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        'connections_per_node': ES_CONNECTIONS_PER_NODE,
+        'request_timeout': ES_REQUEST_TIMEOUT,
+        'max_retries': ES_MAX_RETRIES,
+        'retry_on_timeout': True,
+        'retry_on_status': (502, 503, 504),
+        'sniff_on_start': ES_SNIFF,
+        'sniff_on_node_failure': ES_SNIFF
+    }
+
+def document_version(document: Document) -> int:
+    """External version of a document: its updated_at in microseconds since the epoch"""
+    return _microseconds(document.updated_at or document.created_at or datetime.utcnow())
+
+def _microseconds(moment: datetime) -> int:
+    return (moment - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+# Identical searches and query encodes in flight at the same time run once per worker
+search_flight = SingleFlight('search')
+query_embedding_flight = SingleFlight('query_embedding')
+
+# Source fields returned by default: everything the response model shows except the hit metadata
+RESULT_SOURCE_FIELDS = [name for name in SearchResult.model_fields if name not in ('id', 'score', 'highlights')]
+# Long arabic_indonesian fields that snippet mode returns as highlighted fragments instead of in full;
+# no_match_size keeps the start of the field when none of the query terms occur in it
+SNIPPET_FIELDS = {
+    'question': {'fragment_size': 200, 'number_of_fragments': 1, 'no_match_size': 200},
+    'answer': {'fragment_size': 150, 'number_of_fragments': 3, 'no_match_size': 150},
+    'prolog': {'fragment_size': 150, 'number_of_fragments': 1},
+    'mushoheh': {'fragment_size': 150, 'number_of_fragments': 2},
+    'historical_context': {'fragment_size': 150, 'number_of_fragments': 1}
+}
 
 class EnhancedSearchService:
+    # The index only has to be checked once per process, not once per service instance
+    _index_ready = False
+    _init_lock = threading.Lock()
+    _es_client: Optional[Elasticsearch] = None
+    _es_client_pid: Optional[int] = None
+    _write_indices_cache = (0.0, [])
+    _async_client: Optional[AsyncElasticsearch] = None
+    _async_client_pid: Optional[int] = None
+
     def __init__(self):
-        # Initialize Elasticsearch client
-        self.es = Elasticsearch([os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200')])
-        # Initialize BERT model for Indonesian/Arabic text
-        self.bert_model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
-        
-        # Create index if not exists
-        if not self.es.indices.exists(index='documents'):
-            self.es.indices.create(
-                index='documents',
-                body={
-                    'settings': {
-                        'analysis': {
-                            'analyzer': {
-                                'arabic_indonesian': {
-                                    'type': 'custom',
-                                    'tokenizer': 'standard',
-                                    'filter': [
-                                        'lowercase',
-                                        'arabic_normalization',
-                                        'indonesian_stop',
-                                        'indonesian_stemmer'
-                                    ]
-                                }
-                            },
-                            'filter': {
-                                'indonesian_stop': {
-                                    'type': 'stop',
-                                    'stopwords': '_indonesian_'
-                                },
-                                'indonesian_stemmer': {
-                                    'type': 'stemmer',
-                                    'language': 'indonesian'
-                                }
-                            }
+        # Elasticsearch clients and their connection pools are shared by all instances
+        # of a process; searches use the async client (see aes), indexing and admin
+        # calls the sync one (see es)
+
+        # BERT model for Indonesian/Arabic text, shared through the model registry
+        self.bert_model = model_registry.acquire(MPNET_SENTENCE_MODEL)
+        # Query encodes from concurrent searches are batched into one forward pass
+        self.query_batcher = get_embedding_batcher(MPNET_SENTENCE_MODEL)
+
+        try:
+            self._ensure_index()
+        except Exception:
+            self.close()
+            raise
+
+    @classmethod
+    def _get_client(cls) -> Elasticsearch:
+        """Sync client, created in each worker process so forked workers never share its sockets"""
+        with cls._init_lock:
+            if cls._es_client is None or cls._es_client_pid != os.getpid():
+                cls._es_client = Elasticsearch(ELASTICSEARCH_URL, **_client_options())
+                cls._es_client_pid = os.getpid()
+            return cls._es_client
+
+    @property
+    def es(self) -> Elasticsearch:
+        return self._get_client()
+
+    @property
+    def aes(self) -> AsyncElasticsearch:
+        """Async client for searches, created in each worker process on first use"""
+        cls = EnhancedSearchService
+        with cls._init_lock:
+            if cls._async_client is None or cls._async_client_pid != os.getpid():
+                cls._async_client = AsyncElasticsearch(ELASTICSEARCH_URL, **_client_options())
+                cls._async_client_pid = os.getpid()
+            return cls._async_client
+
+    @classmethod
+    async def close_async_client(cls) -> None:
+        """Close this process's async client and its connections"""
+        client, cls._async_client = cls._async_client, None
+        if client is not None and cls._async_client_pid == os.getpid():
+            await client.close()
+
+    def close(self) -> None:
+        """Release the shared embedding model held by this service"""
+        model_registry.release(MPNET_SENTENCE_MODEL)
+
+    def _ensure_index(self) -> None:
+        """Create the documents index and its aliases if they do not exist yet"""
+        if EnhancedSearchService._index_ready:
+            return
+        with EnhancedSearchService._init_lock:
+            if EnhancedSearchService._index_ready:
+                return
+            self._create_index_if_missing()
+            EnhancedSearchService._index_ready = True
+
+    def _create_index_if_missing(self) -> None:
+        """Create the first versioned index behind the read and write aliases.
+
+        A concrete index still named like the read alias (created before the
+        indices were versioned) is used as is until the next rebuild replaces it.
+        """
+        if self.es.indices.exists(index=INDEX_ALIAS):
+            return
+        self._create_index(aliases={INDEX_ALIAS: {}, WRITE_ALIAS: {'is_write_index': True}})
+
+    def _create_index(self, aliases: Optional[Dict[str, Any]] = None, building: bool = False) -> str:
+        """Create a new versioned index and return its name.
+
+        An index being built has refresh and replicas turned off until
+        _finish_build restores them.
+        """
+        name = f"{INDEX_ALIAS}-v{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+        body = self._index_body()
+        if building:
+            body['settings']['index'] = {'refresh_interval': '-1', 'number_of_replicas': 0,
+                                         'gc_deletes': REBUILD_GC_DELETES}
+        if aliases:
+            body['aliases'] = aliases
+        self.es.indices.create(index=name, body=body)
+        return name
+
+    def _index_body(self) -> Dict[str, Any]:
+        return {
+            'settings': {
+                'analysis': {
+                    'analyzer': {
+                        'arabic_indonesian': {
+                            'type': 'custom',
+                            'tokenizer': 'standard',
+                            'filter': [
+                                'lowercase',
+                                'arabic_normalization',
+                                'indonesian_stop',
+                                'indonesian_stemmer'
+                            ]
                         }
                     },
-                    'mappings': {
-                        'properties': {
-                            'title': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'question': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'answer': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'prolog': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'mushoheh': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'historical_context': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'geographical_context': {'type': 'text', 'analyzer': 'arabic_indonesian'},
-                            'publication_date': {'type': 'date'},
-                            'madhab_ids': {'type': 'integer'},
-                            'category_ids': {'type': 'integer'},
-                            'text_embedding': {'type': 'dense_vector', 'dims': 768}
+                    'filter': {
+                        'indonesian_stop': {
+                            'type': 'stop',
+                            'stopwords': '_indonesian_'
+                        },
+                        'indonesian_stemmer': {
+                            'type': 'stemmer',
+                            'language': 'indonesian'
                         }
                     }
                 }
-            )
-    
+            },
+            'mappings': {
+                'properties': {
+                    'title': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'question': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'answer': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'prolog': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'mushoheh': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'historical_context': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'geographical_context': {'type': 'text', 'analyzer': 'arabic_indonesian'},
+                    'publication_date': {'type': 'date'},
+                    # Tiebreaker of paged searches
+                    'id': {'type': 'integer'},
+                    'madhab_ids': {'type': 'integer'},
+                    'category_ids': {'type': 'integer'},
+                    'text_embedding': {
+                        'type': 'dense_vector',
+                        'dims': 768,
+                        'index': True,
+                        'similarity': 'cosine',
+                        'index_options': {'type': 'hnsw', 'm': HNSW_M, 'ef_construction': HNSW_EF_CONSTRUCTION}
+                    }
+                }
+            }
+        }
+
+    def rebuild_index(self, documents: Iterable[Document], delete_old: bool = False, **bulk_options) -> Dict[str, Any]:
+        """Rebuild the search index into a new versioned index without search downtime.
+
+        The new index joins the write alias first, so documents saved during
+        the rebuild reach both indices. Every write carries the document's
+        updated_at as its external version, so a backfilled row read before
+        such a save loses to it instead of overwriting it, and the new index
+        keeps deletes for REBUILD_GC_DELETES so it cannot re-add a document
+        deleted meanwhile. Once it is filled, its refresh interval
+        and replicas are restored and the read and write aliases are moved to
+        it in one atomic update_aliases call. documents must be lazy (a query
+        or generator): it is only iterated once dual writes are in effect.
+        """
+        old_indices = self._alias_indices(INDEX_ALIAS)
+        new_index = self._create_index(building=True)
+        write_indices = self._alias_indices(WRITE_ALIAS)
+        self.es.indices.update_aliases(actions=[{'add': {'index': new_index, 'alias': WRITE_ALIAS}}] + [
+            # A pre-alias index has no write alias yet; add it so it keeps receiving writes
+            {'add': {'index': index, 'alias': WRITE_ALIAS}} for index in old_indices if index not in write_indices
+        ])
+        # Let every worker's cached write targets pick up the new index before streaming
+        time.sleep(WRITE_ALIAS_CACHE_SECONDS)
+
+        try:
+            result = self.bulk_index_documents(documents, indices=[new_index], **bulk_options)
+            if result['failed']:
+                raise RuntimeError(f"{result['failed']} documents failed to index into {new_index}")
+            self._finish_build(new_index)
+        except Exception:
+            self.es.indices.update_aliases(actions=[{'remove': {'index': new_index, 'alias': WRITE_ALIAS}}])
+            self.es.indices.delete(index=new_index)
+            raise
+
+        actions = []
+        for index in old_indices:
+            if index == INDEX_ALIAS:
+                # Pre-alias concrete index: drop it in the same atomic call that creates the alias
+                actions.append({'remove_index': {'index': index}})
+            else:
+                actions.append({'remove': {'index': index, 'alias': INDEX_ALIAS}})
+                actions.append({'remove': {'index': index, 'alias': WRITE_ALIAS}})
+        actions.append({'add': {'index': new_index, 'alias': INDEX_ALIAS}})
+        actions.append({'add': {'index': new_index, 'alias': WRITE_ALIAS, 'is_write_index': True}})
+        self.es.indices.update_aliases(actions=actions)
+        search_cache.invalidate()
+
+        if delete_old:
+            for index in old_indices:
+                if index != INDEX_ALIAS:
+                    self.es.indices.delete(index=index)
+        result['index'] = new_index
+        result['previous_indices'] = old_indices
+        return result
+
+    def _finish_build(self, index: str) -> None:
+        """Restore serving settings on a freshly built index and wait for its replicas"""
+        self.es.indices.put_settings(index=index, settings={
+            'index': {'refresh_interval': INDEX_REFRESH_INTERVAL, 'number_of_replicas': INDEX_REPLICAS,
+                      'gc_deletes': None}
+        })
+        self.es.indices.refresh(index=index)
+        # Serving from an index whose replicas are still recovering would load the primaries alone
+        self.es.cluster.health(index=index, wait_for_status='green' if INDEX_REPLICAS else 'yellow',
+                               timeout=INDEX_HEALTH_TIMEOUT)
+
+    def _alias_indices(self, alias: str) -> List[str]:
+        """Indices behind an alias; a concrete index of that name is returned as itself"""
+        if self.es.indices.exists_alias(name=alias):
+            return sorted(self.es.indices.get_alias(name=alias).keys())
+        if self.es.indices.exists(index=alias):
+            return [alias]
+        return []
+
+    def _write_indices(self) -> List[str]:
+        """Indices every document write must reach, cached for a few seconds per process"""
+        cached_at, indices = EnhancedSearchService._write_indices_cache
+        if time.monotonic() - cached_at < WRITE_ALIAS_CACHE_SECONDS and indices:
+            return indices
+        indices = self._alias_indices(WRITE_ALIAS) or [INDEX_ALIAS]
+        EnhancedSearchService._write_indices_cache = (time.monotonic(), indices)
+        return indices
+
     def index_document(self, document: Document) -> None:
         """Index a document in Elasticsearch with BERT embeddings"""
-        # Generate text embedding
-        text_for_embedding = f"{document.title} {document.question} {document.answer}"
-        embedding = self.bert_model.encode(text_for_embedding)
-        
-        # Prepare document for indexing
-        doc = {
+        embedding = self.bert_model.encode(self._embedding_text(document))
+        body = self._document_body(document, embedding)
+        for index in self._write_indices():
+            # wait_for returns once the document is searchable, so the cache
+            # cannot be refilled with results computed before the write
+            self.es.index(index=index, id=str(document.id), body=body, refresh='wait_for',
+                          version=document_version(document), version_type='external_gte')
+        search_cache.invalidate()
+
+    def delete_document(self, document_id: int) -> None:
+        """Remove a document from every write index"""
+        # Versioned after every save, so a rebuild's backfill cannot re-add the document
+        version = _microseconds(datetime.utcnow())
+        for index in self._write_indices():
+            self.es.options(ignore_status=404).delete(index=index, id=str(document_id), refresh='wait_for',
+                                                      version=version, version_type='external')
+        search_cache.invalidate()
+
+    def bulk_index_documents(self, documents: Iterable[Document],
+                             encode_batch_size: int = BULK_ENCODE_BATCH_SIZE,
+                             chunk_size: int = BULK_CHUNK_SIZE,
+                             thread_count: int = BULK_THREAD_COUNT,
+                             indices: Optional[List[str]] = None,
+                             on_progress: Optional[Callable[[int, int, int], None]] = None) -> Dict[str, Any]:
+        """Index many documents through the bulk API.
+
+        Embeddings are encoded encode_batch_size documents at a time and the
+        actions are sent in chunk_size requests by thread_count parallel
+        workers, to indices (the write alias targets by default).
+        Each document becomes one action per target index; it counts as
+        indexed once all of them succeeded and as failed otherwise. A
+        version conflict counts as success: the index already holds a newer
+        save or a delete of the document.
+        on_progress(indexed, failed, last_id) is called after every
+        document; last_id only advances while every earlier document succeeded,
+        so it is a safe point to resume from.
+        """
+        targets = indices or self._write_indices()
+        indexed = failed = 0
+        last_id = 0
+        errors = []
+        # Document id -> [actions still outstanding, whether any of them failed]
+        pending: Dict[str, List[Any]] = {}
+        documents = iter(documents)
+        for ok, item in parallel_bulk(
+            self.es,
+            self._bulk_actions(documents, encode_batch_size, targets),
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            raise_on_error=False
+        ):
+            document_id = item['index']['_id']
+            state = pending.setdefault(document_id, [len(targets), False])
+            state[0] -= 1
+            if not ok and item['index'].get('status') != 409:
+                state[1] = True
+                errors.append(item)
+            if state[0]:
+                continue
+            del pending[document_id]
+            if state[1]:
+                failed += 1
+            else:
+                indexed += 1
+                if not failed:
+                    last_id = int(document_id)
+            if on_progress:
+                on_progress(indexed, failed, last_id)
+        if indices is None and indexed:
+            # Writes to the live indices change search results once they are refreshed
+            self.es.indices.refresh(index=self._write_indices())
+            search_cache.invalidate()
+        return {'indexed': indexed, 'failed': failed, 'last_id': last_id, 'errors': errors}
+
+    def _bulk_actions(self, documents: Iterator[Document], encode_batch_size: int,
+                      indices: List[str]) -> Iterator[Dict[str, Any]]:
+        """Bulk index actions, encoding the embeddings a batch of documents at a time"""
+        while True:
+            batch = list(islice(documents, encode_batch_size))
+            if not batch:
+                return
+            embeddings = self.bert_model.encode(
+                [self._embedding_text(document) for document in batch],
+                batch_size=64, convert_to_numpy=True
+            )
+            for document, embedding in zip(batch, embeddings):
+                body = self._document_body(document, embedding)
+                for index in indices:
+                    yield {
+                        '_op_type': 'index',
+                        '_index': index,
+                        '_id': str(document.id),
+                        'version': document_version(document),
+                        'version_type': 'external_gte',
+                        '_source': body
+                    }
+
+    def _embedding_text(self, document: Document) -> str:
+        return f"{document.title} {document.question} {document.answer}"
+
+    def _document_body(self, document: Document, embedding) -> Dict[str, Any]:
+        """Source stored in the index for a document"""
+        return {
+            'id': document.id,
             'title': document.title,
             'question': document.question,
             'answer': document.answer,
@@ -83,49 +443,302 @@ class EnhancedSearchService:
             'category_ids': [c.id for c in document.categories],
             'text_embedding': embedding.tolist()
         }
-        
-        self.es.index(index='documents', id=str(document.id), body=doc)
     
-    def search_documents(self, search_params: DocumentSearch, semantic_search: bool = False) -> List[Dict[str, Any]]:
-        """Enhanced search with both text-based and semantic search capabilities"""
-        # Build base query
+    async def search_documents(self, search_params: DocumentSearch, semantic_search: bool = False,
+                               hybrid_search: bool = False) -> Dict[str, Any]:
+        """Enhanced search with text-based, semantic and hybrid search capabilities.
+
+        Returns a page of hits, each with its id, score and the requested
+        source fields, the total and its relation ('eq', or 'gte' when it is
+        only a lower bound), the cursor of the next page or None, and the time in milliseconds spent in each stage. Pages
+        are cached until a document changes (see services.search_cache), and
+        identical searches arriving while one is running share its result.
+        """
+        started = time.perf_counter()
+        key = search_cache.key(search_params, semantic_search=semantic_search, hybrid_search=hybrid_search, paged=True)
+        key, page = await search_cache.get(key)
+        if page is not None:
+            return dict(page, timings={'cache': (time.perf_counter() - started) * 1000})
+
+        async def search_and_cache():
+            result = await self._search_documents(search_params, semantic_search, hybrid_search)
+            page = {name: value for name, value in result.items() if name != 'timings'}
+            await search_cache.set(key, page, (time.perf_counter() - started) * 1000)
+            return result
+
+        return await search_flight.do(key, search_and_cache)
+
+    async def _search_documents(self, search_params: DocumentSearch, semantic_search: bool,
+                                hybrid_search: bool) -> Dict[str, Any]:
+        size = search_params.limit if hasattr(search_params, 'limit') else 10
+        cursor = decode_cursor(search_params.cursor) if getattr(search_params, 'cursor', None) else None
+        filters = self._filters(search_params)
+        source = self._source_filter(search_params)
+        highlight = self._highlight(search_params)
+        timings: Dict[str, float] = {}
+
+        if search_params.query and (hybrid_search or semantic_search):
+            # kNN has no search_after; these pages are offsets within the top k
+            offset = self._cursor_offset(cursor, search_params)
+            if hybrid_search:
+                hits, total, relation = await self._hybrid_search(
+                    search_params, size, offset, filters, source, highlight, timings
+                )
+            else:
+                # Approximate kNN over the HNSW graph; filters are applied while traversing it
+                query_embedding = await self._encode_query(search_params.query, timings)
+                k = offset + size + 1
+                found, timings['semantic'] = await self._timed_search({
+                    'size': size + 1,
+                    'from': offset,
+                    '_source': source,
+                    'knn': self._knn_clause(query_embedding, k, filters, getattr(search_params, 'num_candidates', None)),
+                    **highlight
+                })
+                hits = found['hits']
+                total = found['total']['value']
+                # kNN finds at most k documents, so reaching k only bounds the matches from below
+                relation = 'gte' if found['total']['relation'] != 'eq' or total >= k else 'eq'
+            if cursor is not None:
+                total, relation = self._cursor_total(cursor)
+            next_cursor = None
+            if len(hits) > size:
+                next_cursor = encode_cursor({'offset': offset + size, 'total': total, 'relation': relation})
+        else:
+            hits, total, relation, next_cursor = await self._keyset_search(
+                search_params, size, cursor, filters, source, highlight, timings
+            )
+
+        results = []
+        for hit in hits[:size]:
+            result = dict(hit.get('_source', {}), id=int(hit['_id']), score=hit['_score'])
+            if highlight:
+                result['highlights'] = hit.get('highlight', {})
+            results.append(result)
+        return {
+            'hits': results,
+            'total': total,
+            'total_relation': relation,
+            'next_cursor': next_cursor,
+            'timings': timings
+        }
+
+    async def _keyset_search(self, search_params: DocumentSearch, size: int, cursor: Optional[Dict[str, Any]],
+                             filters: List[Dict[str, Any]], source: Dict[str, Any], highlight: Dict[str, Any],
+                             timings: Dict[str, float]):
+        """Lexical or filter-only page that continues after the last hit of the previous one.
+
+        Later pages search a point-in-time, opened by the second page and
+        carried in the cursor, so they see one consistent snapshot however
+        deep they go; search_after costs the same on every page, unlike from.
+        The total is counted exactly up to EXACT_TOTAL_LIMIT hits on the first
+        page and carried along in the cursor.
+        """
+        sort = [{'publication_date': 'desc'}, {'id': {'order': 'desc', 'unmapped_type': 'integer'}}]
+        if search_params.query:
+            sort.insert(0, {'_score': 'desc'})
+        body = {
+            'size': size + 1,
+            '_source': source,
+            'query': self._lexical_query(search_params.query, filters),
+            'sort': sort,
+            **highlight
+        }
+
+        pit_id = None
+        if cursor is None:
+            body['from'] = getattr(search_params, 'offset', 0)
+            body['track_total_hits'] = EXACT_TOTAL_LIMIT
+            found, timings['lexical'] = await self._timed_search(body)
+            total = found['total']['value']
+            relation = found['total']['relation']
+        else:
+            if 'after' not in cursor:
+                raise ValueError('Invalid cursor')
+            body['search_after'] = cursor['after']
+            body['track_total_hits'] = False
+            total, relation = self._cursor_total(cursor)
+            pit_id = cursor.get('pit')
+            for attempt in range(2):
+                if pit_id is None:
+                    pit_id = (await self.aes.open_point_in_time(index=INDEX_ALIAS, keep_alive=PIT_KEEP_ALIVE))['id']
+                body['pit'] = {'id': pit_id, 'keep_alive': PIT_KEEP_ALIVE}
+                try:
+                    found, timings['lexical'] = await self._timed_search(body)
+                    break
+                except NotFoundError:
+                    # The point-in-time expired; continue from the same sort values in a new one
+                    if attempt:
+                        raise
+                    pit_id = None
+            pit_id = found.get('pit_id', pit_id)
+
+        hits = found['hits']
+        if len(hits) > size:
+            state = {'after': hits[size - 1]['sort'], 'total': total, 'relation': relation}
+            if pit_id is not None:
+                state['pit'] = pit_id
+            return hits, total, relation, encode_cursor(state)
+        if pit_id is not None:
+            try:
+                await self.aes.close_point_in_time(id=pit_id)
+            except Exception as e:
+                logger.warning(f"Could not close point-in-time: {str(e)}")
+        return hits, total, relation, None
+
+    def _cursor_offset(self, cursor: Optional[Dict[str, Any]], search_params: DocumentSearch) -> int:
+        if cursor is None:
+            return getattr(search_params, 'offset', 0)
+        if not isinstance(cursor.get('offset'), int) or cursor['offset'] < 0:
+            raise ValueError('Invalid cursor')
+        return cursor['offset']
+
+    def _cursor_total(self, cursor: Dict[str, Any]):
+        """Total and its relation, counted on the first page and carried in the cursor"""
+        if not isinstance(cursor.get('total'), int) or cursor.get('relation') not in ('eq', 'gte'):
+            raise ValueError('Invalid cursor')
+        return cursor['total'], cursor['relation']
+
+    async def _hybrid_search(self, search_params: DocumentSearch, size: int, offset: int,
+                       filters: List[Dict[str, Any]], source: Dict[str, Any], highlight: Dict[str, Any],
+                       timings: Dict[str, float]):
+        """Run the lexical and kNN legs concurrently and fuse their rankings.
+
+        Each leg retrieves fusion_depth hits (at least offset + size + 1) with
+        the same filters; deeper fusion finds more documents that only one leg
+        ranks highly, at the cost of both legs' latency. Returns the page, one
+        extra hit when there is a next page, and the number of fused hits,
+        with 'gte' when a leg was cut off at the depth and it is only a lower
+        bound, 'eq' otherwise.
+        """
+        depth = max(getattr(search_params, 'fusion_depth', None) or HYBRID_FUSION_DEPTH, offset + size + 1)
+
+        async def semantic_leg():
+            # The query is encoded while the lexical leg is already running
+            query_embedding = await self._encode_query(search_params.query, timings)
+            return await self._timed_search({
+                'size': depth,
+                '_source': source,
+                'knn': self._knn_clause(query_embedding, depth, filters, getattr(search_params, 'num_candidates', None)),
+                **highlight
+            })
+
+        (lexical, timings['lexical']), (semantic, timings['semantic']) = await asyncio.gather(
+            self._timed_search({
+                'size': depth,
+                '_source': source,
+                'query': self._lexical_query(search_params.query, filters),
+                **highlight
+            }),
+            semantic_leg()
+        )
+        lexical_hits, semantic_hits = lexical['hits'], semantic['hits']
+
+        started = time.perf_counter()
+        if getattr(search_params, 'fusion', 'rrf') == 'weighted':
+            weight = getattr(search_params, 'semantic_weight', 0.5)
+            fused = weighted_score_fusion([lexical_hits, semantic_hits], [1 - weight, weight])
+        else:
+            fused = reciprocal_rank_fusion([lexical_hits, semantic_hits])
+        timings['fusion'] = (time.perf_counter() - started) * 1000
+        relation = 'gte' if len(lexical_hits) >= depth or len(semantic_hits) >= depth else 'eq'
+        return fused[offset:offset + size + 1], len(fused), relation
+
+    def _source_filter(self, search_params: DocumentSearch) -> Dict[str, Any]:
+        """Only fetch the fields the response shows; the embedding is never returned"""
+        fields = getattr(search_params, 'fields', None) or RESULT_SOURCE_FIELDS
+        if getattr(search_params, 'snippets', False):
+            # Full text is left to GET /api/documents/{id}
+            fields = [field for field in fields if field not in SNIPPET_FIELDS]
+        return {'includes': fields, 'excludes': ['text_embedding']}
+
+    def _highlight(self, search_params: DocumentSearch) -> Dict[str, Any]:
+        """Highlight request of snippet mode, or nothing when full text is returned"""
+        if not getattr(search_params, 'snippets', False):
+            return {}
+        fields = getattr(search_params, 'fields', None) or RESULT_SOURCE_FIELDS
+        highlight: Dict[str, Any] = {
+            'fields': {field: options for field, options in SNIPPET_FIELDS.items() if field in fields},
+            'pre_tags': ['<em>'],
+            'post_tags': ['</em>'],
+            'encoder': 'html'
+        }
+        if search_params.query:
+            # kNN hits have no lexical query to highlight; match the query text instead
+            highlight['highlight_query'] = {
+                'multi_match': {'query': search_params.query, 'fields': list(SNIPPET_FIELDS)}
+            }
+        return {'highlight': highlight}
+
+    async def _encode_query(self, text: str, timings: Dict[str, float]):
+        """Query embedding, from the cache or else the shared batcher, without blocking the event loop"""
+        started = time.perf_counter()
+        text = normalize_query(text)
+        model = MPNET_SENTENCE_MODEL.model
+        embedding = query_embedding_cache.get(model, text)
+        if embedding is None:
+            async def encode():
+                encoded = await asyncio.wrap_future(self.query_batcher.submit(text))
+                query_embedding_cache.put(model, text, encoded)
+                return encoded
+
+            embedding = await query_embedding_flight.do((model, text), encode)
+        timings['encode'] = (time.perf_counter() - started) * 1000
+        return embedding
+
+    async def _timed_search(self, body: Dict[str, Any]):
+        """Hits section (total and hits) of a search and its wall time in milliseconds.
+
+        Searches the read alias, or the point-in-time named in the body.
+        """
+        started = time.perf_counter()
+        index = None if 'pit' in body else INDEX_ALIAS
+        results = await self.aes.options(request_timeout=SEARCH_REQUEST_TIMEOUT).search(index=index, body=body)
+        hits = results['hits']
+        if 'pit_id' in results:
+            hits = dict(hits, pit_id=results['pit_id'])
+        return hits, (time.perf_counter() - started) * 1000
+
+    def _lexical_query(self, text: Optional[str], filters: List[Dict[str, Any]]) -> Dict[str, Any]:
         query = {
             'bool': {
                 'must': [],
-                'filter': []
+                'filter': filters
             }
         }
-        
-        if search_params.query:
-            if semantic_search:
-                # Semantic search using BERT embeddings
-                query_embedding = self.bert_model.encode(search_params.query)
-                query['bool']['must'].append({
-                    'script_score': {
-                        'query': {'match_all': {}},
-                        'script': {
-                            'source': "cosineSimilarity(params.query_vector, 'text_embedding') + 1.0",
-                            'params': {'query_vector': query_embedding.tolist()}
-                        }
-                    }
-                })
-            else:
-                # Text-based search with fuzzy matching
-                query['bool']['must'].append({
-                    'multi_match': {
-                        'query': search_params.query,
-                        'fields': ['title^3', 'question^2', 'answer', 'prolog', 'mushoheh', 
-                                  'historical_context', 'geographical_context'],
-                        'fuzziness': 'AUTO'
-                    }
-                })
-        
-        # Add filters
+        if text:
+            # Text-based search with fuzzy matching
+            query['bool']['must'].append({
+                'multi_match': {
+                    'query': text,
+                    'fields': ['title^3', 'question^2', 'answer', 'prolog', 'mushoheh', 
+                              'historical_context', 'geographical_context'],
+                    'fuzziness': 'AUTO'
+                }
+            })
+        return query
+
+    def _knn_clause(self, query_vector, k: int, filters: List[Dict[str, Any]],
+                    num_candidates: Optional[int] = None) -> Dict[str, Any]:
+        """Top-level kNN search clause; num_candidates trades latency for recall"""
+        clause = {
+            'field': 'text_embedding',
+            'query_vector': [float(value) for value in query_vector],
+            'k': k,
+            'num_candidates': max(num_candidates or KNN_NUM_CANDIDATES, k)
+        }
+        if filters:
+            clause['filter'] = filters
+        return clause
+
+    def _filters(self, search_params: DocumentSearch) -> List[Dict[str, Any]]:
+        """Madhab, category and date filters of a search"""
+        filters = []
         if search_params.madhab_ids:
-            query['bool']['filter'].append({'terms': {'madhab_ids': search_params.madhab_ids}})
+            filters.append({'terms': {'madhab_ids': search_params.madhab_ids}})
         
         if search_params.category_ids:
-            query['bool']['filter'].append({'terms': {'category_ids': search_params.category_ids}})
+            filters.append({'terms': {'category_ids': search_params.category_ids}})
         
         if search_params.start_date or search_params.end_date:
             date_filter = {'range': {'publication_date': {}}}
@@ -133,16 +746,5 @@ class EnhancedSearchService:
                 date_filter['range']['publication_date']['gte'] = search_params.start_date
             if search_params.end_date:
                 date_filter['range']['publication_date']['lte'] = search_params.end_date
-            query['bool']['filter'].append(date_filter)
-        
-        # Execute search
-        results = self.es.search(
-            index='documents',
-            body={
-                'query': query,
-                'size': search_params.limit if hasattr(search_params, 'limit') else 10,
-                'from': search_params.offset if hasattr(search_params, 'offset') else 0
-            }
-        )
-        
-        return [hit['_source'] for hit in results['hits']['hits']]
\ No newline at end of file
+            filters.append(date_filter)
+        return filters
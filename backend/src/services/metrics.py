@@ -0,0 +1,118 @@
+from typing import Dict, List, Any, Optional, Sequence
+import bisect
+import threading
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self, description: str = ''):
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'type': 'counter', 'description': self.description, 'value': self._value}
+
+class Gauge:
+    """Value that can go up and down"""
+
+    def __init__(self, description: str = ''):
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'type': 'gauge', 'description': self.description, 'value': self._value}
+
+class Histogram:
+    """Distribution of observed values over fixed upper-bound buckets"""
+
+    def __init__(self, buckets: Sequence[float], description: str = ''):
+        self.description = description
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + [float('inf')], self._counts):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+            return {
+                'type': 'histogram',
+                'description': self.description,
+                'count': self._count,
+                'sum': self._sum,
+                'buckets': buckets
+            }
+
+class MetricsRegistry:
+    """In-process metrics, exported as JSON by the /api/metrics route.
+
+    Values are per worker process; aggregate across workers when scraping.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str = '') -> Counter:
+        return self._get_or_create(name, lambda: Counter(description))
+
+    def gauge(self, name: str, description: str = '') -> Gauge:
+        return self._get_or_create(name, lambda: Gauge(description))
+
+    def histogram(self, name: str, buckets: Sequence[float], description: str = '') -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(buckets, description))
+
+    def snapshot(self, prefix: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = list(self._metrics.items())
+        return {
+            name: metric.snapshot()
+            for name, metric in sorted(items)
+            if prefix is None or name.startswith(prefix)
+        }
+
+    def _get_or_create(self, name: str, factory) -> Any:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+metrics = MetricsRegistry()
@@ -0,0 +1,245 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import os
+import threading
+import time
+import torch
+from transformers import (
+    pipeline,
+    AutoTokenizer,
+    AutoModelForSequenceClassification,
+    AutoModelForTokenClassification,
+)
+from sentence_transformers import SentenceTransformer
+from services.logger import logger
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Identifies a loadable model by kind, checkpoint name and task"""
+    kind: str  # pipeline, sentence_transformer or tokenizer
+    model: str
+    task: Optional[str] = None
+    options: Tuple[Tuple[str, Any], ...] = ()
+
+    @property
+    def key(self) -> Tuple[str, str, Optional[str], Tuple[Tuple[str, Any], ...]]:
+        return (self.kind, self.model, self.task, self.options)
+
+# Models used across the services, declared once so every caller shares the same instance
+INDOBERT_CLASSIFIER = ModelSpec(
+    'pipeline', 'indolem/indobert-base-uncased',
+    task='text-classification', options=(('return_all_scores', True),)
+)
+INDOBERT_NER = ModelSpec(
+    'pipeline', 'indolem/indobert-base-uncased-ner',
+    task='token-classification', options=(('aggregation_strategy', 'simple'),)
+)
+INDOBERT_TOKENIZER = ModelSpec('tokenizer', 'indolem/indobert-base-uncased')
+MINILM_SENTENCE_MODEL = ModelSpec('sentence_transformer', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+MPNET_SENTENCE_MODEL = ModelSpec('sentence_transformer', 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
+LAYOUTLM_CLASSIFIER = ModelSpec(
+    'pipeline', 'microsoft/layoutlm-base-uncased',
+    task='text-classification', options=(('return_all_scores', True),)
+)
+MBERT_CLASSIFIER = ModelSpec(
+    'pipeline', 'bert-base-multilingual-cased',
+    task='text-classification', options=(('return_all_scores', True),)
+)
+MBERT_NER = ModelSpec(
+    'pipeline', 'bert-base-multilingual-cased',
+    task='token-classification', options=(('aggregation_strategy', 'simple'),)
+)
+
+# Models loaded by the gunicorn master before forking workers (see gunicorn.conf.py)
+PRELOAD_SPECS = (
+    INDOBERT_CLASSIFIER,
+    INDOBERT_NER,
+    INDOBERT_TOKENIZER,
+    MINILM_SENTENCE_MODEL,
+    MPNET_SENTENCE_MODEL,
+    LAYOUTLM_CLASSIFIER,
+)
+
+# A model nobody holds or has fetched for this long is unloaded on the next release
+MODEL_IDLE_UNLOAD_SECONDS = float(os.getenv('MODEL_IDLE_UNLOAD_SECONDS', '900'))
+
+# Head classes used to build pipeline models ourselves so the encoder can be shared
+_TASK_MODEL_CLASSES = {
+    'text-classification': AutoModelForSequenceClassification,
+    'token-classification': AutoModelForTokenClassification,
+}
+
+class ModelRegistry:
+    """Process-wide registry that loads each model lazily and only once.
+
+    Models are keyed by ModelSpec. Pipelines built from the same checkpoint
+    share the tokenizer and the encoder weights; only the task heads differ.
+    Callers hold models with acquire()/release(); once a model has been
+    neither held nor fetched for MODEL_IDLE_UNLOAD_SECONDS it is unloaded.
+    Preloaded models are pinned: their pages are shared with the master.
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple, Any] = {}
+        self._refcounts: Dict[Tuple, int] = {}
+        self._specs: Dict[Tuple, ModelSpec] = {}
+        self._backbones: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._last_used: Dict[Tuple, float] = {}
+        self._pinned: Set[Tuple] = set()
+
+    def get(self, spec: ModelSpec) -> Any:
+        """Return the model for spec, loading it on first use"""
+        model = self._models.get(spec.key)
+        if model is not None:
+            self._last_used[spec.key] = time.monotonic()
+            return model
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(spec.key, threading.Lock())
+
+        # Per-key lock so concurrent first requests do not load the same model twice
+        with key_lock:
+            model = self._models.get(spec.key)
+            if model is None:
+                logger.info(f"Loading model {spec.model} ({spec.kind}, task={spec.task})")
+                model = self._load(spec)
+                with self._lock:
+                    self._models[spec.key] = model
+                    self._specs[spec.key] = spec
+                    self._refcounts.setdefault(spec.key, 0)
+            self._last_used[spec.key] = time.monotonic()
+            return model
+
+    def acquire(self, spec: ModelSpec) -> Any:
+        """Return the model for spec and register the caller as a user of it"""
+        model = self.get(spec)
+        with self._lock:
+            self._refcounts[spec.key] = self._refcounts.get(spec.key, 0) + 1
+        return model
+
+    def acquire_all(self, specs: Iterable[ModelSpec]) -> List[Any]:
+        """Acquire every spec in order, or none: on a failure the ones already acquired are released"""
+        acquired = []
+        try:
+            for spec in specs:
+                acquired.append((spec, self.acquire(spec)))
+        except Exception:
+            for spec, _ in acquired:
+                self.release(spec)
+            raise
+        return [model for _, model in acquired]
+
+    def release(self, spec: ModelSpec) -> None:
+        """Drop one reference taken with acquire(), then unload models idle for too long"""
+        with self._lock:
+            if self._refcounts.get(spec.key, 0) > 0:
+                self._refcounts[spec.key] -= 1
+                if self._refcounts[spec.key] == 0:
+                    self._last_used[spec.key] = time.monotonic()
+        self.unload_unused(MODEL_IDLE_UNLOAD_SECONDS)
+
+    def unload_unused(self, idle_for: float = 0) -> List[ModelSpec]:
+        """Unload every unpinned model no caller holds and none has fetched for idle_for seconds"""
+        unloaded = []
+        now = time.monotonic()
+        with self._lock:
+            for key, count in list(self._refcounts.items()):
+                if (count == 0 and key in self._models and key not in self._pinned
+                        and now - self._last_used.get(key, 0) >= idle_for):
+                    del self._models[key]
+                    self._last_used.pop(key, None)
+                    unloaded.append(self._specs.pop(key))
+            # Forget backbones no remaining pipeline refers to
+            in_use = {spec.model for spec in self._specs.values()}
+            for name in list(self._backbones):
+                if name not in in_use:
+                    del self._backbones[name]
+        for spec in unloaded:
+            logger.info(f"Unloaded model {spec.model} ({spec.kind}, task={spec.task})")
+        return unloaded
+
+    def warmup(self, specs: Iterable[ModelSpec]) -> None:
+        """Load the given models and run one tiny inference so first requests are not cold"""
+        for spec in specs:
+            try:
+                model = self.get(spec)
+                if spec.kind == 'pipeline':
+                    model('warmup')
+                elif spec.kind == 'sentence_transformer':
+                    model.encode(['warmup'])
+                elif spec.kind == 'tokenizer':
+                    model('warmup')
+            except Exception as e:
+                logger.warning(f"Warmup failed for model {spec.model}: {str(e)}")
+
+    def preload(self, specs: Iterable[ModelSpec]) -> None:
+        """Load models ahead of time and make their weights read-only.
+
+        Meant to run in the gunicorn master before the fork: workers then share
+        the weight pages copy-on-write as long as nothing writes to them.
+        No inference is run here because the intra-op thread pool must not be
+        started before forking.
+        """
+        for spec in specs:
+            try:
+                self.get(spec)
+            except Exception as e:
+                logger.warning(f"Preload failed for model {spec.model}: {str(e)}")
+        with self._lock:
+            self._pinned.update(self._models)
+            for model in self._models.values():
+                _freeze(model)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Loaded models with their reference counts"""
+        with self._lock:
+            return {
+                f"{spec.kind}:{spec.model}:{spec.task or ''}": {
+                    'refcount': self._refcounts.get(key, 0)
+                }
+                for key, spec in self._specs.items()
+            }
+
+    def _load(self, spec: ModelSpec) -> Any:
+        if spec.kind == 'tokenizer':
+            return AutoTokenizer.from_pretrained(spec.model)
+        if spec.kind == 'sentence_transformer':
+            model = SentenceTransformer(spec.model)
+            model.eval()
+            return model
+        if spec.kind == 'pipeline':
+            return self._load_pipeline(spec)
+        raise ValueError(f"Unknown model kind: {spec.kind}")
+
+    def _load_pipeline(self, spec: ModelSpec) -> Any:
+        options = dict(spec.options)
+        model_class = _TASK_MODEL_CLASSES.get(spec.task)
+        if model_class is None:
+            # Unknown task: let transformers resolve everything itself
+            return pipeline(spec.task, model=spec.model, **options)
+
+        tokenizer = self.get(ModelSpec('tokenizer', spec.model))
+        model = model_class.from_pretrained(spec.model)
+
+        # Reuse the encoder of an already loaded head on the same checkpoint
+        prefix = model.base_model_prefix
+        with self._lock:
+            backbone = self._backbones.get(spec.model)
+            if backbone is None:
+                self._backbones[spec.model] = getattr(model, prefix)
+            else:
+                setattr(model, prefix, backbone)
+
+        model.eval()
+        return pipeline(spec.task, model=model, tokenizer=tokenizer, **options)
+
+def _freeze(model: Any) -> None:
+    """Put a model in inference mode so no tensor storage is ever written"""
+    module = getattr(model, 'model', model)  # pipelines wrap the torch module
+    if isinstance(module, torch.nn.Module):
+        module.eval()
+        module.requires_grad_(False)
+
+model_registry = ModelRegistry()
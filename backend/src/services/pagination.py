@@ -0,0 +1,42 @@
+from typing import Any, Dict, Tuple
+import base64
+import binascii
+import json
+import os
+from sqlalchemy import func, literal, select
+from sqlalchemy.orm import Query, Session
+
+# Totals up to this many matches are counted exactly; larger ones are estimated
+EXACT_TOTAL_LIMIT = int(os.getenv('EXACT_TOTAL_LIMIT', '10000'))
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Opaque, URL-safe next-page token holding the position of the last result"""
+    payload = json.dumps(state, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """State of a cursor made by encode_cursor; raises ValueError for anything else"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(state, dict):
+        raise ValueError('Invalid cursor')
+    return state
+
+def count_matches(db: Session, query: Query, exact_limit: int = EXACT_TOTAL_LIMIT) -> Tuple[int, str]:
+    """Number of rows a query matches and its relation: 'eq', or 'estimate'.
+
+    Counts exactly, stopping after exact_limit + 1 rows, so small result sets
+    cost one bounded count. Beyond that the planner's row estimate is used,
+    which costs no scan at all.
+    """
+    matches = query.order_by(None).limit(None).offset(None)
+    bounded = matches.with_entities(literal(1)).limit(exact_limit + 1).subquery()
+    count = db.execute(select(func.count()).select_from(bounded)).scalar()
+    if count <= exact_limit:
+        return count, 'eq'
+
+    compiled = matches.statement.compile(db.get_bind())
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    return max(int(plan[0]['Plan']['Plan Rows']), count), 'estimate'
@@ -2,26 +2,29 @@ from typing import Dict, List, Optional, Any, Union
 from datetime import datetime
 import os
 import PyPDF2
-from transformers import pipeline
 from torch import Tensor
 from .schemas import DocumentCreate
 from .logger import logger
+from .model_registry import model_registry, MBERT_CLASSIFIER, MBERT_NER
 
 class PDFProcessor:
+    MODEL_SPECS = (MBERT_CLASSIFIER, MBERT_NER)
+
     def __init__(self):
-        # Initialize text classification pipeline
-        self.classifier = pipeline(
-            "text-classification",
-            model="bert-base-multilingual-cased",  # Supports Arabic and Indonesian
-            return_all_scores=True
-        )
-        
-        # Initialize NER pipeline for metadata extraction
-        self.ner = pipeline(
-            "token-classification",
-            model="bert-base-multilingual-cased",
-            aggregation_strategy="simple"
-        )
+        # Text classification pipeline (multilingual BERT supports Arabic and Indonesian)
+        # and NER pipeline for metadata extraction, which shares the encoder weights
+        self.classifier, self.ner = model_registry.acquire_all(self.MODEL_SPECS)
+
+    def close(self) -> None:
+        """Release the shared models held by this processor"""
+        for spec in self.MODEL_SPECS:
+            model_registry.release(spec)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         if not os.path.exists(pdf_path):
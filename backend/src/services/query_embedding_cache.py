@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+import atexit
+import json
+import os
+import threading
+import time
+import unicodedata
+import numpy as np
+from services.logger import logger
+from services.metrics import metrics
+
+# Query embeddings kept per worker (about 3 KB each at 768 dimensions) and for how long
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '10000'))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '86400'))
+# Optional .npz file the hot set is saved to at exit and loaded from on first use
+QUERY_EMBEDDING_CACHE_PATH = os.getenv('QUERY_EMBEDDING_CACHE_PATH')
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a query, so trivially different spellings share an embedding"""
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query embeddings keyed by model id and normalized query text.
+
+    Values are float32 vectors. Entries expire ttl seconds after they were
+    encoded; expiry uses wall-clock time so it survives a save and reload.
+    """
+
+    def __init__(self, maxsize: int = QUERY_EMBEDDING_CACHE_SIZE, ttl: float = QUERY_EMBEDDING_CACHE_TTL,
+                 path: Optional[str] = QUERY_EMBEDDING_CACHE_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded_pid: Optional[int] = None
+        self._hits = metrics.counter('query_embedding_cache_hits', 'Query embeddings served from the cache')
+        self._misses = metrics.counter('query_embedding_cache_misses', 'Query embeddings that had to be encoded')
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        self._ensure_loaded()
+        key = (model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] + self.ttl > time.time():
+                self._entries.move_to_end(key)
+                self._hits.inc()
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        self._misses.inc()
+        return None
+
+    def put(self, model: str, text: str, embedding: np.ndarray) -> None:
+        self._ensure_loaded()
+        self._put((model, text), time.time(), np.asarray(embedding, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def save(self) -> None:
+        """Write the live entries to path atomically"""
+        if self.path is None:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [(key, created, vector) for key, (created, vector) in self._entries.items()
+                       if created + self.ttl > now]
+        if not entries:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp,
+            keys=np.array(json.dumps([key for key, _, _ in entries])),
+            created=np.array([created for _, created, _ in entries], dtype=np.float64),
+            vectors=np.stack([vector for _, _, vector in entries])
+        )
+        os.replace(tmp, self.path)
+
+    def _put(self, key: Tuple[str, str], created: float, vector: np.ndarray) -> None:
+        with self._lock:
+            self._entries[key] = (created, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _ensure_loaded(self) -> None:
+        # Each worker loads the saved hot set once and saves its own on exit
+        if self.path is None or self._loaded_pid == os.getpid():
+            return
+        with self._lock:
+            if self._loaded_pid == os.getpid():
+                return
+            self._loaded_pid = os.getpid()
+            atexit.register(self.save)
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                keys = json.loads(str(data['keys']))
+                for (model, text), created, vector in zip(keys, data['created'], data['vectors']):
+                    if created + self.ttl > time.time():
+                        self._put((model, text), float(created), vector.astype(np.float32))
+            logger.info(f"Loaded {len(self)} cached query embeddings from {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not load query embedding cache {self.path}: {str(e)}")
+
+query_embedding_cache = QueryEmbeddingCache()
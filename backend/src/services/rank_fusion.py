@@ -0,0 +1,30 @@
+from typing import Any, Dict, List
+import os
+
+# Rank constant of reciprocal rank fusion; larger values flatten the top ranks
+RRF_RANK_CONSTANT = int(os.getenv('RRF_RANK_CONSTANT', '60'))
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], rank_constant: int = RRF_RANK_CONSTANT) -> List[Dict[str, Any]]:
+    """Fuse ranked hit lists by summing 1 / (rank_constant + rank) per document"""
+    scores: Dict[str, float] = {}
+    hits: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit['_id']] = scores.get(hit['_id'], 0.0) + 1.0 / (rank_constant + rank)
+            hits.setdefault(hit['_id'], hit)
+    return [dict(hits[doc_id], _score=score) for doc_id, score in sorted(scores.items(), key=lambda item: -item[1])]
+
+def weighted_score_fusion(rankings: List[List[Dict[str, Any]]], weights: List[float]) -> List[Dict[str, Any]]:
+    """Fuse hit lists by a weighted sum of their min-max normalized scores"""
+    scores: Dict[str, float] = {}
+    hits: Dict[str, Dict[str, Any]] = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        values = [hit['_score'] or 0.0 for hit in ranking]
+        low, high = min(values), max(values)
+        for hit, value in zip(ranking, values):
+            normalized = (value - low) / (high - low) if high > low else 1.0
+            scores[hit['_id']] = scores.get(hit['_id'], 0.0) + weight * normalized
+            hits.setdefault(hit['_id'], hit)
+    return [dict(hits[doc_id], _score=score) for doc_id, score in sorted(scores.items(), key=lambda item: -item[1])]
@@ -1,42 +1,53 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from models.bahtsul_masail import Document
+from sqlalchemy import and_, or_, cast, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from models.bahtsul_masail import Document, SEARCH_TS_CONFIG, TRIGRAM_COLUMNS
 from schemas.bahtsul_masail import DocumentSearch
+from services.pagination import count_matches, decode_cursor, encode_cursor
 from datetime import datetime
-from typing import List
+from typing import Any, Dict
 
-def search_documents(db: Session, search_params: DocumentSearch) -> List[Document]:
+def search_documents(db: Session, search_params: DocumentSearch) -> Dict[str, Any]:
     """
     Advanced search function that supports:
-    - Full text search across title, question, and answer
+    - Full text search across all text fields, ranked by ts_rank_cd
+    - Fuzzy (trigram) search on title, question and mushoheh, ranked by word similarity
     - Filtering by madhab and category
     - Date range filtering
-    - Pagination (to be implemented)
+    - Keyset pagination: pass the returned next_cursor to get the next page
+
+    Returns the page of documents, the total and its relation ('eq', or
+    'estimate' when large, see services.pagination) and the cursor of the
+    next page, or None on the last.
     """
     query = db.query(Document)
+    rank = None
+
+    # Typo-tolerant search on the trigram-indexed columns
+    if search_params.query and search_params.mode == 'fuzzy':
+        # <% uses this threshold and can use the GIN trigram indexes; it only
+        # lasts for the current transaction
+        db.execute(select(func.set_config(
+            'pg_trgm.word_similarity_threshold', str(search_params.similarity_threshold), True
+        )))
+        term = literal(search_params.query)
+        columns = [getattr(Document, column) for column in TRIGRAM_COLUMNS]
+        query = query.filter(or_(*(term.op('<%')(column) for column in columns)))
+        rank = func.greatest(*(func.word_similarity(term, column) for column in columns))
+
+    # Full text search on the GIN-indexed search_vector column
+    elif search_params.query:
+        ts_query = func.websearch_to_tsquery(SEARCH_TS_CONFIG, search_params.query)
+        query = query.filter(Document.search_vector.op('@@')(ts_query))
+        rank = func.ts_rank_cd(Document.search_vector, ts_query)
 
-    # Full text search
-    if search_params.query:
-        search_filter = or_(
-            Document.title.ilike(f"%{search_params.query}%"),
-            Document.question.ilike(f"%{search_params.query}%"),
-            Document.answer.ilike(f"%{search_params.query}%"),
-            Document.prolog.ilike(f"%{search_params.query}%"),
-            Document.mushoheh.ilike(f"%{search_params.query}%"),
-            Document.historical_context.ilike(f"%{search_params.query}%"),
-            Document.geographical_context.ilike(f"%{search_params.query}%")
-        )
-        query = query.filter(search_filter)
-
-    # Filter by madhabs
+    # Filter by madhabs and categories: documents linked to any of the given
+    # ids, as in Elasticsearch, with one GIN-indexed overlap (&&) predicate each
     if search_params.madhab_ids:
-        query = query.filter(Document.madhabs.any(id=madhab_id) 
-                           for madhab_id in search_params.madhab_ids)
+        query = query.filter(Document.madhab_ids.overlap(search_params.madhab_ids))
 
-    # Filter by categories
     if search_params.category_ids:
-        query = query.filter(Document.categories.any(id=category_id) 
-                           for category_id in search_params.category_ids)
+        query = query.filter(Document.category_ids.overlap(search_params.category_ids))
 
     # Date range filter
     date_filters = []
@@ -48,7 +59,54 @@ def search_documents(db: Session, search_params: DocumentSearch) -> List[Documen
     if date_filters:
         query = query.filter(and_(*date_filters))
 
-    # Order by relevance (to be improved with proper text search ranking)
-    query = query.order_by(Document.publication_date.desc())
+    # The total is counted with the first page and carried along in the cursor
+    cursor = decode_cursor(search_params.cursor) if search_params.cursor else None
+    if cursor is None:
+        total, total_relation = count_matches(db, query)
+    else:
+        total, total_relation = cursor.get('total'), cursor.get('relation')
+        if not isinstance(total, int) or total_relation not in ('eq', 'estimate'):
+            raise ValueError('Invalid cursor')
+
+    # Order by relevance, newest first among equally relevant rulings. Pages
+    # continue after the last row of the previous one, which the
+    # (publication_date, id) index serves at any depth, unlike OFFSET.
+    if rank is not None:
+        # Both rank functions return real; selecting and comparing it as double
+        # precision makes the value stored in the cursor round-trip exactly
+        rank = cast(rank, DOUBLE_PRECISION).label('rank')
+        query = query.add_columns(rank)
+        order = [rank, Document.publication_date, Document.id]
+    else:
+        order = [Document.publication_date, Document.id]
+    if cursor is not None:
+        try:
+            after = [datetime.fromisoformat(cursor['date']), int(cursor['id'])]
+            if rank is not None:
+                after.insert(0, cast(float(cursor['rank']), DOUBLE_PRECISION))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        query = query.filter(tuple_(*order) < tuple_(*after))
+    query = query.order_by(*(column.desc() for column in order))
+
+    # One extra row tells whether there is a next page
+    rows = query.limit(search_params.limit + 1).all()
+    has_next = len(rows) > search_params.limit
+    rows = rows[:search_params.limit]
+    documents = [row[0] for row in rows] if rank is not None else rows
+
+    next_cursor = None
+    if has_next:
+        last = documents[-1]
+        state = {'date': last.publication_date.isoformat(), 'id': last.id,
+                 'total': total, 'relation': total_relation}
+        if rank is not None:
+            state['rank'] = rows[-1][1]
+        next_cursor = encode_cursor(state)
 
-    return query.all()
\ No newline at end of file
+    return {
+        'documents': documents,
+        'total': total,
+        'total_relation': total_relation,
+        'next_cursor': next_cursor
+    }
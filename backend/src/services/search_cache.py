@@ -0,0 +1,211 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from pydantic import BaseModel
+from services.logger import logger
+from services.metrics import metrics
+
+# Entries kept by each worker and how long any entry may be served
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1024'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '300'))
+# Optional tier shared by all workers and hosts; also holds the shared generation
+SEARCH_CACHE_REDIS_URL = os.getenv('SEARCH_CACHE_REDIS_URL')
+# Without Redis the generation lives in this file, shared by the workers of one host
+SEARCH_CACHE_GENERATION_FILE = Path(os.getenv(
+    'SEARCH_CACHE_GENERATION_FILE', Path(__file__).parent.parent.parent / 'cache' / 'search_generation'
+))
+
+SAVED_MS_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+class SearchCache:
+    """Cache of search responses keyed by a canonical hash of the search parameters.
+
+    Lookups try an in-process LRU first, then the shared Redis tier when
+    SEARCH_CACHE_REDIS_URL is set. Every key embeds a generation number;
+    invalidate() bumps it, which makes every cached search unreachable at once
+    in all workers without enumerating keys. Old entries age out through the
+    LRU and the TTL. Writers to the search index call invalidate() once their
+    write is visible to searches (see EnhancedSearchService.index_document).
+    """
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL,
+                 redis_url: Optional[str] = SEARCH_CACHE_REDIS_URL,
+                 generation_file: Path = SEARCH_CACHE_GENERATION_FILE):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self.generation_file = generation_file
+        self._entries: 'OrderedDict[str, Tuple[float, float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_pid: Optional[int] = None
+        self._sync_redis = None
+        self._sync_redis_pid: Optional[int] = None
+
+        self._hits = {tier: metrics.counter(f'search_cache_hits{{tier="{tier}"}}', 'Searches served from the cache')
+                      for tier in ('local', 'shared')}
+        self._misses = metrics.counter('search_cache_misses', 'Searches that had to run')
+        self._hit_ratio = metrics.gauge('search_cache_hit_ratio', 'Share of searches served from the cache')
+        self._saved_ms = metrics.counter('search_cache_saved_ms', 'Search time saved by cache hits')
+        self._saved_ms_per_hit = metrics.histogram(
+            'search_cache_saved_ms_per_hit', SAVED_MS_BUCKETS, 'Original run time of searches served from the cache'
+        )
+        self._invalidations = metrics.counter('search_cache_invalidations', 'Cache generation bumps')
+
+    def key(self, params: BaseModel, **options: Any) -> str:
+        """Canonical hash of the parameters; equivalent searches map to the same key"""
+        values = params.model_dump(mode='json')
+        values.update(options)
+        if isinstance(values.get('query'), str):
+            values['query'] = ' '.join(values['query'].split()) or None
+        for name in ('madhab_ids', 'category_ids', 'fields'):
+            if values.get(name):
+                values[name] = sorted(set(values[name]))
+        canonical = json.dumps(values, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    async def get(self, key: str) -> Tuple[str, Optional[Any]]:
+        """Look a key up under the current generation.
+
+        Returns the generation-qualified key to store the computed result
+        under, so a result computed across an invalidation is stored under the
+        old generation and never served, and the cached value or None.
+        """
+        full_key = f"{await self._generation()}:{key}"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(full_key)
+                return full_key, self._hit('local', entry[1], entry[2])
+            if entry is not None:
+                del self._entries[full_key]
+
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                data = await redis.get(f"search:{full_key}")
+            except Exception as e:
+                logger.warning(f"Shared search cache unavailable: {str(e)}")
+                data = None
+            if data is not None:
+                took_ms, value = json.loads(data)
+                self._store_local(full_key, took_ms, value)
+                return full_key, self._hit('shared', took_ms, value)
+
+        self._misses.inc()
+        self._update_ratio()
+        return full_key, None
+
+    async def set(self, full_key: str, value: Any, took_ms: float) -> None:
+        """Cache a search result, under the key get returned, with the time it took to compute"""
+        self._store_local(full_key, took_ms, value)
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                await redis.set(f"search:{full_key}", json.dumps([took_ms, value], default=str), ex=int(self.ttl))
+            except Exception as e:
+                logger.warning(f"Shared search cache unavailable: {str(e)}")
+
+    def invalidate(self) -> None:
+        """Make every cached search stale in all workers by bumping the generation"""
+        self._invalidations.inc()
+        with self._lock:
+            self._entries.clear()
+        redis = self._get_sync_redis()
+        if redis is not None:
+            try:
+                redis.incr('search:generation')
+                return
+            except Exception as e:
+                logger.warning(f"Could not bump the shared search cache generation: {str(e)}")
+        self.generation_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.generation_file, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            current = int(f.read().strip() or 0)
+            f.seek(0)
+            f.truncate()
+            f.write(str(current + 1))
+            f.flush()
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, float]:
+        hits = sum(counter.value for counter in self._hits.values())
+        return {
+            'entries': len(self._entries),
+            'hits': hits,
+            'misses': self._misses.value,
+            'hit_ratio': self._hit_ratio.value,
+            'saved_ms': self._saved_ms.value
+        }
+
+    def _hit(self, tier: str, took_ms: float, value: Any) -> Any:
+        self._hits[tier].inc()
+        self._saved_ms.inc(took_ms)
+        self._saved_ms_per_hit.observe(took_ms)
+        self._update_ratio()
+        return value
+
+    def _update_ratio(self) -> None:
+        hits = sum(counter.value for counter in self._hits.values())
+        total = hits + self._misses.value
+        self._hit_ratio.set(hits / total if total else 0.0)
+
+    def _store_local(self, full_key: str, took_ms: float, value: Any) -> None:
+        with self._lock:
+            self._entries[full_key] = (time.monotonic() + self.ttl, took_ms, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    async def _generation(self) -> str:
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                return (await redis.get('search:generation') or b'0').decode()
+            except Exception as e:
+                logger.warning(f"Shared search cache unavailable: {str(e)}")
+        try:
+            return self.generation_file.read_text().strip() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def _get_redis(self):
+        """Async Redis client of this process, or None when there is no shared tier"""
+        if not self.redis_url:
+            return None
+        if self._redis is None or self._redis_pid != os.getpid():
+            try:
+                import redis.asyncio
+            except ImportError:
+                logger.warning("SEARCH_CACHE_REDIS_URL is set but the redis package is not installed")
+                self.redis_url = None
+                return None
+            self._redis = redis.asyncio.Redis.from_url(self.redis_url)
+            self._redis_pid = os.getpid()
+        return self._redis
+
+    def _get_sync_redis(self):
+        """Sync Redis client of this process for invalidate, which document writers call from threads"""
+        if not self.redis_url:
+            return None
+        with self._lock:
+            if self._sync_redis is None or self._sync_redis_pid != os.getpid():
+                try:
+                    import redis
+                except ImportError:
+                    logger.warning("SEARCH_CACHE_REDIS_URL is set but the redis package is not installed")
+                    self.redis_url = None
+                    return None
+                self._sync_redis = redis.Redis.from_url(self.redis_url)
+                self._sync_redis_pid = os.getpid()
+            return self._sync_redis
+
+search_cache = SearchCache()
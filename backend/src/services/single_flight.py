@@ -0,0 +1,35 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+from services.metrics import metrics
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls into one execution.
+
+    The first caller for a key starts the call; callers arriving with the same
+    key while it is in flight await the same task and get its result or its
+    exception. Nothing is kept once the call finishes, so this only absorbs
+    bursts; caching is a separate layer. Waiters are shielded from each other:
+    one cancelled request does not cancel the shared call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._executed = metrics.counter(f'single_flight_executed{{call="{name}"}}', 'Calls that ran')
+        self._coalesced = metrics.counter(
+            f'single_flight_coalesced{{call="{name}"}}', 'Calls that joined an identical call in flight'
+        )
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            self._executed.inc()
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self._coalesced.inc()
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
@@ -1,20 +1,48 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import os
+import threading
+import time
 import numpy as np
 from sqlalchemy.orm import Session
 from models.document_chunk import DocumentChunk
+from services.ann_index import IVFIndex
+from services.embedding_codec import encode_embedding, decode_embeddings
+from services.embedding_matrix import EmbeddingMatrix, TOMBSTONE
 from services.logger import logger
+from services.model_registry import MPNET_SENTENCE_MODEL
+
+# Seconds between checks for chunks stored by other worker processes
+ANN_SYNC_INTERVAL = float(os.getenv('ANN_SYNC_INTERVAL', '30'))
+# Candidates fetched from the ANN index per requested result, making up for
+# chunks other workers deleted since the last sync
+ANN_OVERFETCH = int(os.getenv('ANN_OVERFETCH', '2'))
 
 class VectorStore:
+    # One ANN index per process, shared by every VectorStore instance
+    _index: Optional[IVFIndex] = None
+    _index_lock = threading.Lock()
+    _max_indexed_id = 0
+    _last_sync = 0.0
+    # Memory-mapped embedding matrix, shared by every worker on the host through the page cache
+    _matrix: Optional[EmbeddingMatrix] = None
+    _matrix_lock = threading.Lock()
+
     def __init__(self, db: Session):
         self.db = db
         self.dimension = 768  # Default dimension for multilingual-mpnet-base-v2
+        self.model_name = MPNET_SENTENCE_MODEL.model
 
     def store_embeddings(self, document_id: int, chunks: List[Dict[str, Any]]) -> None:
         """Store document chunks with their embeddings"""
         try:
+            # Open (or build) the matrix before committing, so a first build
+            # from the table cannot already contain the chunks appended below
+            matrix = self._get_matrix()
+            stored = []
             for chunk in chunks:
-                if not chunk.get('embedding'):
+                embedding = chunk.get('embedding')
+                if embedding is None or len(embedding) == 0:
                     logger.warning(f"Chunk without embedding for document {document_id}")
                     continue
 
@@ -24,39 +52,61 @@ class VectorStore:
                     chunk_type=chunk['type'],
                     page_number=chunk.get('page_number'),
                     section_title=chunk.get('section_title'),
-                    embedding=chunk['embedding'],
+                    embedding=encode_embedding(embedding, self.model_name),
                     metadata=chunk.get('metadata', {})
                 )
                 self.db.add(doc_chunk)
+                stored.append((doc_chunk, embedding))
 
             self.db.commit()
+
+            # Keep the embedding matrix and the ANN index in step with the table
+            if stored:
+                ids = [doc_chunk.id for doc_chunk, _ in stored]
+                vectors = np.stack([np.asarray(embedding, dtype=np.float32) for _, embedding in stored])
+                matrix.append(ids, vectors)
+                if VectorStore._index is not None:
+                    VectorStore._index.add(ids, vectors)
         except Exception as e:
             logger.error(f"Error storing embeddings for document {document_id}: {str(e)}")
             self.db.rollback()
             raise
 
-    def search_similar(self, query_embedding: List[float], limit: int = 5) -> List[DocumentChunk]:
-        """Find most similar chunks using cosine similarity"""
-        try:
-            # Convert query embedding to numpy array
-            query_vector = np.array(query_embedding)
+    def search_similar(self, query_embedding: List[float], limit: int = 5,
+                       nprobe: Optional[int] = None, exact: bool = False) -> List[DocumentChunk]:
+        """Find the most similar chunks with the ANN index.
 
-            # Get all chunks with embeddings
-            chunks = self.db.query(DocumentChunk).filter(DocumentChunk.embedding.isnot(None)).all()
-            
-            if not chunks:
+        nprobe overrides how many index lists are scanned (higher is slower
+        but closer to exact); exact=True scans every chunk instead.
+        """
+        if exact:
+            return self.search_similar_exact(query_embedding, limit)
+        try:
+            index = self._get_index()
+            ids, _ = index.search(np.asarray(query_embedding, dtype=np.float32), limit * ANN_OVERFETCH, nprobe)
+            if len(ids) == 0:
                 return []
 
-            # Calculate similarities
-            similarities = []
-            for chunk in chunks:
-                chunk_vector = np.array(chunk.embedding)
-                similarity = self._cosine_similarity(query_vector, chunk_vector)
-                similarities.append((chunk, similarity))
+            # Chunks deleted by another worker since the last sync are missing
+            # from the table; the extra candidates fill their places
+            chunks = self.db.query(DocumentChunk).filter(DocumentChunk.id.in_(ids.tolist())).all()
+            by_id = {chunk.id: chunk for chunk in chunks}
+            return [by_id[chunk_id] for chunk_id in ids.tolist() if chunk_id in by_id][:limit]
 
-            # Sort by similarity and return top matches
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return [chunk for chunk, _ in similarities[:limit]]
+        except Exception as e:
+            logger.error(f"Error performing similarity search: {str(e)}")
+            return []
+
+    def search_similar_exact(self, query_embedding: List[float], limit: int = 5) -> List[DocumentChunk]:
+        """Find most similar chunks using cosine similarity over the embedding matrix"""
+        try:
+            ids, _ = self._get_matrix().search(np.asarray(query_embedding, dtype=np.float32), limit)
+            if len(ids) == 0:
+                return []
+
+            chunks = self.db.query(DocumentChunk).filter(DocumentChunk.id.in_(ids.tolist())).all()
+            by_id = {chunk.id: chunk for chunk in chunks}
+            return [by_id[chunk_id] for chunk_id in ids.tolist() if chunk_id in by_id]
 
         except Exception as e:
             logger.error(f"Error performing similarity search: {str(e)}")
@@ -72,8 +122,13 @@ class VectorStore:
     def delete_document_embeddings(self, document_id: int) -> None:
         """Delete all embeddings for a document"""
         try:
+            chunk_ids = [chunk_id for (chunk_id,) in self.db.query(DocumentChunk.id).filter(DocumentChunk.document_id == document_id)]
             self.db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).delete()
             self.db.commit()
+
+            self._get_matrix().delete(chunk_ids)
+            if VectorStore._index is not None:
+                VectorStore._index.remove(chunk_ids)
         except Exception as e:
             logger.error(f"Error deleting embeddings for document {document_id}: {str(e)}")
             self.db.rollback()
@@ -81,4 +136,74 @@ class VectorStore:
 
     def get_document_chunks(self, document_id: int) -> List[DocumentChunk]:
         """Retrieve all chunks for a document"""
-        return self.db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).all()
\ No newline at end of file
+        return self.db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).all()
+
+    def _get_index(self) -> IVFIndex:
+        """Return the process-wide ANN index, building it from the table on first use"""
+        with VectorStore._index_lock:
+            if VectorStore._index is None:
+                VectorStore._index = IVFIndex(self.dimension)
+                VectorStore._max_indexed_id = 0
+                VectorStore._last_sync = 0.0
+            if time.monotonic() - VectorStore._last_sync >= ANN_SYNC_INTERVAL:
+                self._top_up_matrix(self._get_matrix())
+                self._load_new_chunks(VectorStore._index)
+                VectorStore._last_sync = time.monotonic()
+            return VectorStore._index
+
+    def _load_new_chunks(self, index: IVFIndex) -> None:
+        """Apply the chunks stored and deleted since the last sync, including by other workers"""
+        # Read the index before the matrix: anything store_embeddings added to
+        # the index by then is already in the matrix, so it is not taken for deleted
+        indexed = index.ids()
+        vectors, ids = self._get_matrix().rows()
+        live = ids[ids != TOMBSTONE]
+
+        # Tombstoned in the matrix by another worker, still in this process's index
+        deleted = indexed[~np.isin(indexed, live)]
+        if len(deleted):
+            index.remove(deleted.tolist())
+
+        new = np.flatnonzero((ids > VectorStore._max_indexed_id) & (ids != TOMBSTONE))
+        # Chunks this worker stored were added to the index by store_embeddings;
+        # its ids can be ahead of other workers' lower ones, so the watermark alone cannot skip them
+        new = new[~np.isin(ids[new], indexed)]
+        if len(new):
+            index.add(ids[new], vectors[new])
+        if len(live):
+            VectorStore._max_indexed_id = max(VectorStore._max_indexed_id, int(live.max()))
+
+    def _get_matrix(self) -> EmbeddingMatrix:
+        """Return the shared embedding matrix, building it from the table if no worker has yet"""
+        with VectorStore._matrix_lock:
+            first_open = VectorStore._matrix is None
+            if first_open:
+                VectorStore._matrix = EmbeddingMatrix(self.dimension)
+            matrix = VectorStore._matrix
+            if not matrix.exists() and matrix.initialize(self._iter_stored_embeddings()):
+                logger.info(f"Built embedding matrix with {len(matrix)} rows")
+            elif first_open:
+                self._top_up_matrix(matrix)
+            return matrix
+
+    def _top_up_matrix(self, matrix: EmbeddingMatrix) -> None:
+        """Append chunks committed to the table but missing from the matrix, e.g.
+        because their writer died between the commit and the append"""
+        added = sum(matrix.append(ids, vectors) for ids, vectors in self._iter_stored_embeddings(matrix.max_id()))
+        if added:
+            logger.info(f"Added {added} missing chunks to the embedding matrix")
+
+    def _iter_stored_embeddings(self, after_id: int = 0, batch_size: int = 5000):
+        """Yield (ids, vectors) batches of the stored chunk embeddings after after_id, in id order"""
+        last_id = after_id
+        while True:
+            rows = self.db.query(DocumentChunk.id, DocumentChunk.embedding)\
+                .filter(DocumentChunk.id > last_id)\
+                .filter(DocumentChunk.embedding.isnot(None))\
+                .order_by(DocumentChunk.id)\
+                .limit(batch_size)\
+                .all()
+            if not rows:
+                return
+            yield [row.id for row in rows], decode_embeddings([row.embedding for row in rows], self.dimension)
+            last_id = rows[-1].id
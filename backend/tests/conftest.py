@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the application modules the way the app does, from backend/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
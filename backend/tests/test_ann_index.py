@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from services.ann_index import IVFIndex
+
+DIM = 16
+
+def clustered_vectors(n: int, clusters: int = 8, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    return (centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, DIM))).astype(np.float32)
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argsort(-(vectors @ (query / np.linalg.norm(query))))[:k]
+
+def test_untrained_index_is_an_exact_scan():
+    vectors = clustered_vectors(200)
+    index = IVFIndex(DIM, train_threshold=10_000)
+    index.add(np.arange(200), vectors)
+
+    ids, scores = index.search(vectors[7], 5)
+    assert index.n_lists == 1
+    assert ids[0] == 7
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
+    assert list(ids) == list(exact_top_k(vectors, vectors[7], 5))
+    assert np.all(np.diff(scores) <= 0)
+
+def test_add_replaces_an_existing_id():
+    vectors = clustered_vectors(50)
+    index = IVFIndex(DIM, train_threshold=10_000)
+    index.add(np.arange(50), vectors)
+    index.add([3], -vectors[3:4])
+
+    assert len(index) == 50
+    ids, scores = index.search(-vectors[3], 1)
+    assert ids[0] == 3 and scores[0] == pytest.approx(1.0, abs=1e-5)
+
+def test_remove_drops_ids_from_results():
+    vectors = clustered_vectors(50)
+    index = IVFIndex(DIM, train_threshold=10_000)
+    index.add(np.arange(50), vectors)
+
+    assert index.remove([1, 2, 99]) == 2
+    assert len(index) == 48
+    ids, _ = index.search(vectors[1], 50)
+    assert 1 not in ids and 2 not in ids
+    assert sorted(index.ids().tolist()) == [i for i in range(50) if i not in (1, 2)]
+
+def test_trained_index_with_every_list_probed_is_exact():
+    vectors = clustered_vectors(1000)
+    index = IVFIndex(DIM, train_threshold=256)
+    for start in range(0, 1000, 100):
+        index.add(np.arange(start, start + 100), vectors[start:start + 100])
+
+    assert index.n_lists > 1
+    assert len(index) == 1000
+    for query in vectors[:10]:
+        ids, _ = index.search(query, 10, nprobe=index.n_lists)
+        assert list(ids) == list(exact_top_k(vectors, query, 10))
+
+def test_recall_grows_with_nprobe():
+    vectors = clustered_vectors(2000, clusters=32)
+    index = IVFIndex(DIM, train_threshold=256)
+    index.add(np.arange(2000), vectors)
+    queries = vectors[:50] + 0.3 * np.random.default_rng(1).normal(size=(50, DIM)).astype(np.float32)
+
+    def recall(nprobe: int) -> float:
+        found = sum(len(np.intersect1d(index.search(query, 10, nprobe)[0], exact_top_k(vectors, query, 10)))
+                    for query in queries)
+        return found / (10 * len(queries))
+
+    assert recall(1) <= recall(4) <= recall(index.n_lists) == 1.0
+
+def test_vectors_of_the_wrong_dimension_are_rejected():
+    with pytest.raises(ValueError):
+        IVFIndex(DIM).add([1], np.zeros((1, DIM + 1), dtype=np.float32))
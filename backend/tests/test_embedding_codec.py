@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from services.embedding_codec import (
+    MAGIC, VERSION, decode_embedding, decode_embeddings, encode_embedding, read_header
+)
+
+MODEL = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
+
+def test_float32_round_trip_is_exact():
+    vector = np.random.default_rng(0).normal(size=768).astype(np.float32)
+    data = encode_embedding(vector, MODEL, dtype='float32')
+
+    assert len(data) == read_header(data).offset + 768 * 4
+    np.testing.assert_array_equal(decode_embedding(data), vector)
+
+def test_float16_round_trip_halves_the_values():
+    vector = np.random.default_rng(0).normal(size=768).astype(np.float32)
+    data = encode_embedding(vector, MODEL, dtype='float16')
+
+    decoded = decode_embedding(data)
+    assert decoded.dtype == np.float16
+    assert len(data) == read_header(data).offset + 768 * 2
+    np.testing.assert_allclose(decoded, vector, rtol=1e-3, atol=1e-3)
+
+def test_header_records_model_dimension_and_dtype():
+    header = read_header(encode_embedding(np.zeros(384), 'all-MiniLM-L6-v2', dtype='float16'))
+
+    assert header.model == 'all-MiniLM-L6-v2'
+    assert header.dim == 384
+    assert header.dtype == np.dtype('<f2')
+    # Values start on an 8-byte boundary whatever the model name length
+    assert header.offset % 8 == 0
+
+def test_decode_is_a_read_only_view_of_the_buffer():
+    data = encode_embedding(np.ones(8), MODEL)
+    decoded = decode_embedding(data)
+
+    assert not decoded.flags.writeable
+    assert not decoded.flags.owndata
+
+def test_unknown_header_versions_are_rejected():
+    data = bytearray(encode_embedding(np.ones(8), MODEL))
+    data[len(MAGIC)] = VERSION + 1
+    with pytest.raises(ValueError):
+        read_header(data)
+
+def test_data_without_the_magic_is_rejected():
+    with pytest.raises(ValueError):
+        decode_embedding(np.ones(8, dtype=np.float32).tobytes())
+
+def test_unsupported_dtypes_and_long_model_names_are_rejected():
+    with pytest.raises(ValueError):
+        encode_embedding(np.ones(8), MODEL, dtype='float64')
+    with pytest.raises(ValueError):
+        encode_embedding(np.ones(8), 'm' * 256)
+
+def test_decode_embeddings_stacks_mixed_dtypes_as_float32():
+    vectors = np.random.default_rng(0).normal(size=(3, 16)).astype(np.float32)
+    blobs = [encode_embedding(vectors[0], MODEL, dtype='float32'),
+             encode_embedding(vectors[1], MODEL, dtype='float16'),
+             memoryview(encode_embedding(vectors[2], MODEL, dtype='float32'))]
+
+    matrix = decode_embeddings(blobs, 16)
+    assert matrix.dtype == np.float32 and matrix.shape == (3, 16)
+    np.testing.assert_allclose(matrix, vectors, rtol=1e-3, atol=1e-3)
+
+def test_decode_embeddings_checks_the_dimension():
+    with pytest.raises(ValueError):
+        decode_embeddings([encode_embedding(np.ones(8), MODEL)], 16)
@@ -0,0 +1,26 @@
+import base64
+import pytest
+from services.pagination import decode_cursor, encode_cursor
+
+def test_cursor_round_trip():
+    state = {'date': '2020-06-15T00:00:00', 'id': 42, 'rank': 0.1 + 0.2, 'total': 10001, 'relation': 'estimate'}
+    assert decode_cursor(encode_cursor(state)) == state
+
+def test_search_after_values_and_point_in_time_round_trip():
+    state = {'after': [3.5, 1592179200000, 42], 'pit': 'i6-xAwEY' * 20, 'total': 7, 'relation': 'eq'}
+    assert decode_cursor(encode_cursor(state)) == state
+
+def test_cursors_are_url_safe_and_unpadded():
+    cursor = encode_cursor({'after': ['?/+' * 10], 'offset': 1})
+    assert '=' not in cursor
+    assert set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_')
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    base64.urlsafe_b64encode(b'[1, 2]').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_anything_else_is_rejected_with_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
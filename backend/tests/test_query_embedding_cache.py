@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import services.query_embedding_cache as query_embedding_cache
+from services.query_embedding_cache import QueryEmbeddingCache, normalize_query
+
+MODEL = 'paraphrase-multilingual-mpnet-base-v2'
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of the cache module, moved forward by the test"""
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(query_embedding_cache, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+def test_normalize_query_folds_case_width_and_whitespace():
+    assert normalize_query('  Shalat\tJUMAT \n virtual ') == 'shalat jumat virtual'
+    assert normalize_query('ＳＨＡＬＡＴ') == 'shalat'
+    assert normalize_query('Straße') == normalize_query('STRASSE')
+
+def test_normalize_query_keeps_arabic_text():
+    assert normalize_query(' صلاة  الجمعة ') == 'صلاة الجمعة'
+
+def test_entries_are_served_until_the_ttl(clock):
+    cache = QueryEmbeddingCache(maxsize=10, ttl=60, path=None)
+    cache.put(MODEL, 'shalat jumat', np.ones(4))
+
+    clock.value += 59
+    np.testing.assert_array_equal(cache.get(MODEL, 'shalat jumat'), np.ones(4, dtype=np.float32))
+    clock.value += 2
+    assert cache.get(MODEL, 'shalat jumat') is None
+    assert len(cache) == 0
+
+def test_entries_are_keyed_by_model(clock):
+    cache = QueryEmbeddingCache(maxsize=10, ttl=60, path=None)
+    cache.put(MODEL, 'zakat', np.ones(4))
+    assert cache.get('all-MiniLM-L6-v2', 'zakat') is None
+
+def test_the_least_recently_used_entry_is_evicted(clock):
+    cache = QueryEmbeddingCache(maxsize=2, ttl=60, path=None)
+    cache.put(MODEL, 'a', np.zeros(4))
+    cache.put(MODEL, 'b', np.zeros(4))
+    cache.get(MODEL, 'a')
+    cache.put(MODEL, 'c', np.zeros(4))
+
+    assert cache.get(MODEL, 'b') is None
+    assert cache.get(MODEL, 'a') is not None and cache.get(MODEL, 'c') is not None
+
+def test_saved_entries_reload_with_their_original_expiry(clock, tmp_path):
+    path = tmp_path / 'query_embeddings.npz'
+    cache = QueryEmbeddingCache(maxsize=10, ttl=60, path=str(path))
+    cache.put(MODEL, 'old', np.full(4, 1.0))
+    clock.value += 30
+    cache.put(MODEL, 'new', np.full(4, 2.0))
+    cache.save()
+
+    clock.value += 40
+    reloaded = QueryEmbeddingCache(maxsize=10, ttl=60, path=str(path))
+    assert reloaded.get(MODEL, 'old') is None
+    np.testing.assert_array_equal(reloaded.get(MODEL, 'new'), np.full(4, 2.0, dtype=np.float32))
@@ -0,0 +1,45 @@
+import pytest
+from services.rank_fusion import reciprocal_rank_fusion, weighted_score_fusion
+
+def hits(*pairs):
+    return [{'_id': doc_id, '_score': score, '_source': {'title': doc_id}} for doc_id, score in pairs]
+
+def test_rrf_sums_reciprocal_ranks_across_lists():
+    lexical = hits(('a', 12.0), ('b', 8.0), ('c', 1.0))
+    semantic = hits(('c', 0.9), ('a', 0.8))
+
+    fused = reciprocal_rank_fusion([lexical, semantic], rank_constant=60)
+    scores = {hit['_id']: hit['_score'] for hit in fused}
+
+    assert [hit['_id'] for hit in fused] == ['a', 'c', 'b']
+    assert scores['a'] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores['c'] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores['b'] == pytest.approx(1 / 62)
+
+def test_rrf_ignores_the_raw_scores():
+    fused = reciprocal_rank_fusion([hits(('a', 1000.0), ('b', 0.001)), hits(('b', 0.5), ('a', 0.4))])
+    assert fused[0]['_score'] == pytest.approx(fused[1]['_score'])
+
+def test_fused_hits_keep_their_source_and_get_the_fused_score():
+    fused = reciprocal_rank_fusion([hits(('a', 3.0))], rank_constant=1)
+    assert fused == [{'_id': 'a', '_score': 0.5, '_source': {'title': 'a'}}]
+
+def test_weighted_fusion_normalizes_each_list_before_weighting():
+    lexical = hits(('a', 20.0), ('b', 10.0), ('c', 0.0))
+    semantic = hits(('c', 0.9), ('b', 0.5), ('a', 0.1))
+
+    fused = weighted_score_fusion([lexical, semantic], [0.25, 0.75])
+    scores = {hit['_id']: hit['_score'] for hit in fused}
+
+    assert [hit['_id'] for hit in fused] == ['c', 'b', 'a']
+    assert scores['a'] == pytest.approx(0.25)
+    assert scores['b'] == pytest.approx(0.25 * 0.5 + 0.75 * 0.5)
+    assert scores['c'] == pytest.approx(0.75)
+
+def test_weighted_fusion_handles_empty_lists_and_equal_scores():
+    fused = weighted_score_fusion([[], hits(('a', 0.7), ('b', 0.7))], [0.5, 0.5])
+    assert [hit['_score'] for hit in fused] == [0.5, 0.5]
+
+def test_weighted_fusion_treats_missing_scores_as_zero():
+    fused = weighted_score_fusion([hits(('a', None), ('b', 2.0))], [1.0])
+    assert [hit['_id'] for hit in fused] == ['b', 'a']
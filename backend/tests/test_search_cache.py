@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from schemas.search import SearchParams
+from services.search_cache import SearchCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(maxsize=2, ttl=60, redis_url=None, generation_file=tmp_path / 'generation')
+
+def test_equivalent_searches_share_a_key(cache):
+    first = SearchParams(query='  shalat   jumat ', madhab_ids=[3, 1, 3], category_ids=[2, 1])
+    second = SearchParams(query='shalat jumat', madhab_ids=[1, 3], category_ids=[1, 2])
+    assert cache.key(first) == cache.key(second)
+
+def test_different_searches_and_options_get_different_keys(cache):
+    params = SearchParams(query='shalat jumat')
+    assert cache.key(params) != cache.key(SearchParams(query='shalat id'))
+    assert cache.key(params) != cache.key(params, semantic_search=True)
+    assert cache.key(params, paged=True) == cache.key(params, paged=True)
+
+def test_a_stored_result_is_served_under_the_same_generation(cache):
+    async def scenario():
+        full_key, value = await cache.get('k')
+        assert value is None
+        await cache.set(full_key, {'hits': [1]}, 12.0)
+        return await cache.get('k')
+
+    full_key, value = asyncio.run(scenario())
+    assert full_key == '0:k'
+    assert value == {'hits': [1]}
+
+def test_invalidate_bumps_the_generation_and_drops_entries(cache):
+    async def scenario():
+        full_key, _ = await cache.get('k')
+        await cache.set(full_key, 'stale', 1.0)
+        cache.invalidate()
+        return await cache.get('k')
+
+    full_key, value = asyncio.run(scenario())
+    assert full_key == '1:k'
+    assert value is None
+    assert cache.generation_file.read_text() == '1'
+
+def test_a_result_computed_across_an_invalidation_is_never_served(cache):
+    async def scenario():
+        full_key, _ = await cache.get('k')
+        cache.invalidate()
+        # The search that started before the write finishes after it
+        await cache.set(full_key, 'stale', 1.0)
+        return await cache.get('k')
+
+    assert asyncio.run(scenario())[1] is None
+
+def test_the_generation_is_shared_through_the_file(tmp_path):
+    writer = SearchCache(redis_url=None, generation_file=tmp_path / 'generation')
+    reader = SearchCache(redis_url=None, generation_file=tmp_path / 'generation')
+    writer.invalidate()
+    writer.invalidate()
+    assert asyncio.run(reader.get('k'))[0] == '2:k'
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = SearchCache(ttl=0, redis_url=None, generation_file=tmp_path / 'generation')
+
+    async def scenario():
+        full_key, _ = await cache.get('k')
+        await cache.set(full_key, 'value', 1.0)
+        return await cache.get('k')
+
+    assert asyncio.run(scenario())[1] is None
+
+def test_the_local_tier_evicts_the_least_recently_used(cache):
+    async def scenario():
+        for key in ('a', 'b'):
+            await cache.set(f'0:{key}', key, 1.0)
+        await cache.get('a')
+        await cache.set('0:c', 'c', 1.0)
+        return [(await cache.get(key))[1] for key in ('a', 'b', 'c')]
+
+    assert asyncio.run(scenario()) == ['a', None, 'c']
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from services.single_flight import SingleFlight
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight('test_identical')
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def scenario():
+        return await asyncio.gather(*[flight.do('key', call) for _ in range(10)])
+
+    assert asyncio.run(scenario()) == ['result'] * 10
+    assert len(calls) == 1
+    assert len(flight) == 0
+
+def test_different_keys_run_separately():
+    flight = SingleFlight('test_keys')
+
+    async def scenario():
+        return await asyncio.gather(*[flight.do(key, lambda key=key: asyncio.sleep(0, key)) for key in 'abc'])
+
+    assert asyncio.run(scenario()) == ['a', 'b', 'c']
+
+def test_calls_after_completion_run_again():
+    flight = SingleFlight('test_sequential')
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        return [await flight.do('key', call), await flight.do('key', call)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+def test_every_waiter_gets_the_exception():
+    flight = SingleFlight('test_exception')
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('search failed')
+
+    async def scenario():
+        return await asyncio.gather(*[flight.do('key', call) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(flight) == 0
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight = SingleFlight('test_cancel')
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return 'result'
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do('key', call))
+        second = asyncio.ensure_future(flight.do('key', call))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == 'result'